@@ -0,0 +1,44 @@
+import numpy as np
+
+def constant_current_segments(chunks):
+    # Consecutive grid steps with the same current merged into one segment; current transitions
+    # always fall on segment boundaries. chunks are the (time, current) chunks of
+    # drive_profile.iter_drive_profile; only segment start times and currents are kept.
+    start_times = []
+    currents = []
+    last_current = None
+    end_time = 0.0
+    for time_chunk, current_chunk in chunks:
+        if len(current_chunk) == 0:
+            continue
+        starts = np.nonzero(np.diff(current_chunk) != 0)[0] + 1
+        if current_chunk[0] != last_current:
+            starts = np.concatenate([[0], starts])
+        start_times.append(time_chunk[starts])
+        currents.append(current_chunk[starts])
+        last_current = current_chunk[-1]
+        end_time = time_chunk[-1]
+    if not start_times:
+        return np.zeros(0), np.zeros(0)
+    start_times = np.concatenate(start_times)
+    return np.diff(np.append(start_times, end_time)), np.concatenate(currents)
+
+
+def step_error_rate(dt, I_cells, params_start, params_end, V_RC_change):
+    # Terminal-voltage error per second of step from freezing the parameters at the start SOC.
+    # params_* are (V_OCV, R0, R1, R2) at the start and end SOC: OCV and the settled R0/RC drops
+    # drift with the SOC rate. V_RC_change is the RC voltage change over the step, passed on
+    # voltage-limited steps where the real current tapers while the RC voltages move. Half the
+    # drift is the mean error over the step, and it grows linearly with dt.
+    V_OCV_start, R0_start, R1_start, R2_start = params_start
+    V_OCV_end, R0_end, R1_end, R2_end = params_end
+    drift = (V_OCV_end - V_OCV_start) - I_cells * ((R0_end - R0_start) + (R1_end - R1_start) + (R2_end - R2_start))
+    return 0.5 * np.max(np.abs(drift) + np.abs(V_RC_change)) / dt
+
+
+def next_step_size(error_rate, tolerance, min_dt, max_dt):
+    # The step that brings the error to just under the tolerance; with no drift (idle, or the SOC
+    # clamped) the rest of the segment can be taken at once
+    if error_rate * max_dt <= 0.9 * tolerance:
+        return max_dt
+    return min(max_dt, max(min_dt, 0.9 * tolerance / error_rate))
@@ -0,0 +1,57 @@
+import numpy as np
+
+GAS_CONSTANT = 8.314 # J/molK
+# Parameter-table bands of get_battery_params / get_battery_params_batch
+SOH_BANDS = [0.9, 0.8]
+
+DEFAULT_LIFE = {
+    'update_interval': 86400.0, # s of simulated time between SOH/DCIR updates
+    'cycle_fade_per_efc': 2e-4, # SOH lost per equivalent full cycle at the reference temperature
+    'calendar_fade_per_day': 5.5e-5, # SOH lost per day at the reference temperature
+    'activation_energy': 30000.0, # J/mol, Arrhenius acceleration of both fade terms
+    'reference_temperature': 298.15, # K
+    'dcir_growth_per_fade': 2.0, # DCIR_AgingFactor gained per unit of SOH lost
+    'min_soh': 0.5, # fade stops here; the SOH3 table is the last one anyway and capacity must stay > 0
+}
+
+
+def build_aging_model(life_config, n_cells, capacity, nominal_V=3.7):
+    # life_config is the 'life' section of model_config.json. The model runs on a slow clock: the
+    # solver feeds it every step's dt and cell temperatures, and SOH/DCIR only change once
+    # update_interval of simulated time has passed.
+    params = dict(DEFAULT_LIFE, **{k: v for k, v in life_config.items() if k in DEFAULT_LIFE})
+    return {
+        'params': params,
+        # Energy of one full charge plus one full discharge of a fresh cell, in kWh (as energy_throughput)
+        'efc_energy': 2 * capacity * nominal_V / 1000,
+        'elapsed': 0.0,
+        'T_integral': np.zeros(n_cells),
+        'energy_at_update': np.zeros(n_cells),
+    }
+
+
+def soh_band(SOH):
+    return np.sum([SOH < band for band in SOH_BANDS], axis=0)
+
+
+def aging_step(aging, dt, T, SOH, DCIR_AgingFactor, energy_throughput):
+    # Returns the updated (SOH, DCIR_AgingFactor) when an update is due, otherwise None
+    aging['elapsed'] += dt
+    aging['T_integral'] += T * dt
+    params = aging['params']
+    if aging['elapsed'] < params['update_interval']:
+        return None
+
+    days = aging['elapsed'] / 86400
+    T_mean = aging['T_integral'] / aging['elapsed']
+    arrhenius = np.exp(params['activation_energy'] / GAS_CONSTANT * (1 / params['reference_temperature'] - 1 / T_mean))
+    efc = (energy_throughput - aging['energy_at_update']) / aging['efc_energy']
+    fade = arrhenius * (params['cycle_fade_per_efc'] * efc + params['calendar_fade_per_day'] * days)
+
+    aging['elapsed'] = 0.0
+    aging['T_integral'][:] = 0.0
+    aging['energy_at_update'][:] = energy_throughput
+    # Fade stops at min_soh but never raises SOH, so a cell that starts below it stays where it is
+    new_SOH = np.minimum(SOH, np.maximum(SOH - fade, params['min_soh']))
+    new_DCIR = DCIR_AgingFactor + params['dcir_growth_per_fade'] * (SOH - new_SOH)
+    return new_SOH, new_DCIR
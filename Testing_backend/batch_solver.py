@@ -0,0 +1,164 @@
+# Testing_backend/batch_solver.py
+# Runs many scenarios of one pack and drive profile together: every state array carries a leading
+# scenario axis and each fixed-grid step is one parameter lookup, one group solve and one state
+# update for the whole batch. Scenarios differ in their initial cell state and a scaling of the
+# drive current; voltage limits clamp each scenario's current on its own.
+import json
+import argparse
+import numpy as np
+import h5py
+from battery_params import build_battery_param_tables
+from cell_kernels import resolve_backend
+from reversible_heat import entropic_table
+from pack_step import build_step_model, solve_pack_step, commit_pack_step
+from results_writer import StreamingResultsWriter
+from output_spec import build_output_spec
+from solver_observers import SolverObserver
+from thermal_model import build_thermal_model
+from aging_model import build_aging_model
+from drive_profile import drive_profile_grid, iter_drive_profile
+
+# Per-cell multipliers a scenario may set on top of the pack values (manufacturing spread)
+CELL_FACTORS = ['capacity_factor', 'R0_factor']
+
+
+def build_scenario_states(setup_data, scenarios):
+    # scenarios: one dict per scenario with an optional 'name', a 'current_scale' applied to the drive
+    # profile current, and any of SOC/SOH/DCIR_AgingFactor/temperature or the CELL_FACTORS as one value
+    # for every cell or a per-cell list. Anything not given keeps the setup's initial state (factors 1).
+    initial_state = setup_data['initial_state']
+    n_cells = setup_data['topology']['n_cells']
+    states = {field: np.tile(values, (len(scenarios), 1)) for field, values in initial_state.items()}
+    states.update({field: np.ones((len(scenarios), n_cells)) for field in CELL_FACTORS})
+    current_scale = np.ones(len(scenarios))
+    names = []
+    for s, scenario in enumerate(scenarios):
+        unknown = set(scenario) - set(states) - {'name', 'current_scale'}
+        if unknown:
+            raise ValueError(f"Unsupported scenario fields: {sorted(unknown)}. Use name, current_scale or {list(states)}.")
+        for field in states:
+            if field not in scenario:
+                continue
+            value = np.asarray(scenario[field], dtype=float)
+            if value.ndim and value.shape != (n_cells,):
+                raise ValueError(f"Scenario {s} {field} must be one value or {n_cells} per-cell values.")
+            states[field][s] = value
+        current_scale[s] = scenario.get('current_scale', 1.0)
+        names.append(str(scenario.get('name', f'scenario_{s}')))
+    return states, current_scale, names
+
+
+def run_batched_solver(setup_data, scenarios, h5_path='batch_results.h5', observers=None):
+    if (setup_data.get('adaptive') or {}).get('enabled'):
+        # Adaptive step sizes differ per scenario, which would break the shared time axis
+        raise ValueError("Batched runs use the fixed drive profile grid; disable electrical.adaptive.")
+    topology = setup_data['topology']
+    N_cells = topology['n_cells']
+    drive_profile = setup_data['drive_profile']
+    grid_steps, total_time = drive_profile_grid(drive_profile)
+    capacity = setup_data['capacity']
+    states, current_scale, names = build_scenario_states(setup_data, scenarios)
+    n_scenarios = len(names)
+    shape = (n_scenarios, N_cells)
+    sim_SOC = states['SOC']
+    sim_Temp = states['temperature']
+    sim_SOH = states['SOH']
+    sim_DCIR_AgingFactor = states['DCIR_AgingFactor']
+    cell_capacity = capacity * states['capacity_factor']
+    sim_V_RC1 = np.zeros(shape)
+    sim_V_RC2 = np.zeros(shape)
+    sim_V_term = np.zeros(shape)
+    energy_throughput = np.zeros(shape, dtype='float32')
+    Qgen_cumulative = np.zeros(shape, dtype='float32')
+    thermal_config = setup_data.get('thermal') or {}
+    thermal = build_thermal_model(thermal_config, topology, setup_data['masses']) if thermal_config.get('enabled') else None
+    life_config = setup_data.get('life') or {}
+    # The aging state takes the (scenarios, cells) shape; its update clock is shared by the batch
+    aging = build_aging_model(life_config, shape, cell_capacity) if life_config.get('enabled') else None
+    # Limit counters are per scenario; step counts are shared
+    counters = {
+        'charge_limited_steps': np.zeros(n_scenarios, dtype=int),
+        'discharge_limited_steps': np.zeros(n_scenarios, dtype=int),
+        'module_limited_steps': np.zeros(n_scenarios, dtype=int),
+        'limit_solves': 0,
+        'grid_steps': grid_steps,
+        'solver_steps': 0,
+        'aging_updates': 0,
+        'soh_band_switches': np.zeros(n_scenarios, dtype=int),
+    }
+
+    # Buffers hold every scenario, so the window shrinks with the batch to keep memory near a single run's
+    output_spec = build_output_spec(setup_data.get('output'), topology)
+    writer = StreamingResultsWriter(h5_path, output_spec, buffer_steps=max(100, 1000 // n_scenarios),
+                                    n_scenarios=n_scenarios, topology=topology)
+    scenario_group = writer.file.create_group('scenarios')
+    scenario_group.create_dataset('name', data=names, dtype=h5py.string_dtype())
+    scenario_group.create_dataset('current_scale', data=current_scale)
+    for field, values in states.items():
+        scenario_group.create_dataset(f'initial_{field}', data=values)
+    record_heat = thermal is not None or any(writer.wants(key) for key in ['Qgen', 'Qirrev', 'Qrev', 'Qgen_cumulative'])
+    record_energy = aging is not None or writer.wants('energy_throughput')
+    kernel_backend = resolve_backend(setup_data.get('kernel_backend') or 'auto')
+    entropic = entropic_table(thermal_config.get('entropic_coefficients'))
+    param_tables = setup_data.get('param_tables') or build_battery_param_tables(
+        setup_data['BatteryData_SOH1'], setup_data['BatteryData_SOH2'], setup_data['BatteryData_SOH3'])
+    observers = observers or [SolverObserver()]
+    # Same step as run_electrical_solver, on (scenarios, cells) state arrays
+    step_model = build_step_model(setup_data, param_tables, kernel_backend, entropic, thermal=thermal, aging=aging,
+                                  record_heat=record_heat, record_energy=record_energy, capacity=cell_capacity,
+                                  R0_factor=states['R0_factor'])
+    state = {
+        'SOC': sim_SOC, 'temperature': sim_Temp, 'SOH': sim_SOH, 'DCIR_AgingFactor': sim_DCIR_AgingFactor,
+        'V_RC1': sim_V_RC1, 'V_RC2': sim_V_RC2, 'V_term': sim_V_term,
+        'energy_throughput': energy_throughput, 'Qgen_cumulative': Qgen_cumulative,
+    }
+
+    def commit_step(step):
+        commit_pack_step(step_model, state, step, writer, counters)
+        progress['sim_time'] += step['dt']
+        for observer in observers:
+            observer.on_step(step, progress['sim_time'])
+
+    progress = {'sim_time': 0.0}
+    run_info = {'n_cells': N_cells, 'n_scenarios': n_scenarios, 'grid_steps': grid_steps, 'total_time': total_time}
+    for observer in observers:
+        observer.on_start(run_info)
+
+    try:
+        for time_chunk, current_chunk in iter_drive_profile(drive_profile):
+            for k in range(len(current_chunk)):
+                commit_step(solve_pack_step(step_model, state, time_chunk[k + 1] - time_chunk[k],
+                                            current_scale * current_chunk[k], counters))
+        writer.flush()
+    finally:
+        writer.close(counters)
+
+    limited = counters['charge_limited_steps'] + counters['discharge_limited_steps']
+    if np.any(limited):
+        print(f"Current limited in {np.count_nonzero(limited)} of {n_scenarios} scenarios "
+              f"(up to {np.max(limited)} steps each), {counters['limit_solves']} extra batch solves.")
+    if aging is not None:
+        print(f"Aging: {counters['aging_updates']} SOH/DCIR updates, SOH now {np.min(sim_SOH):.4f}-{np.max(sim_SOH):.4f}.")
+
+    for observer in observers:
+        observer.on_finish(counters)
+    return h5_path
+
+
+if __name__ == '__main__':
+    from data_processor import create_setup_from_json
+
+    parser = argparse.ArgumentParser(description='Run several scenarios of one pack and drive profile as one batch.')
+    parser.add_argument('scenarios', help='JSON list of scenarios, e.g. [{"name": "hot", "temperature": 320}, '
+                                          '{"current_scale": 1.2, "SOC": [0.8, 0.79, ...]}]')
+    parser.add_argument('--pack', default='pack_config.json')
+    parser.add_argument('--drive', default='drive_config.json')
+    parser.add_argument('--model', default='model_config.json')
+    parser.add_argument('--out', default='batch_results.h5')
+    args = parser.parse_args()
+
+    with open(args.scenarios, 'r') as f:
+        scenarios = json.load(f)
+    setup_data = create_setup_from_json(args.pack, args.drive, args.model)
+    run_batched_solver(setup_data, scenarios, h5_path=args.out)
+    print("Results written to", args.out)
@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
 
 def create_mock_battery_data():
     temps = ['T05', 'T15', 'T25', 'T35', 'T45', 'T55']
@@ -52,7 +51,9 @@ def get_battery_params(SOC, cell_temp_C, mode, SOH, DCIR_aging_factor, BatteryDa
     SOC_grid = Data_Temp['T05'][:, 0]
     Temp_grid = np.array(temp_vals)
 
-    # Interpolators
+    # Interpolators (scipy is only needed by this scalar path, so it is imported here)
+    from scipy.interpolate import RegularGridInterpolator
+
     def make_interp(grid):
         return RegularGridInterpolator((SOC_grid, Temp_grid), grid, bounds_error=False, fill_value=None)
 
@@ -78,4 +79,60 @@ def get_battery_params(SOC, cell_temp_C, mode, SOH, DCIR_aging_factor, BatteryDa
     if OCV < 2.5 or OCV > 4.2:
         print(f"Warning: OCV ({OCV:.4f} V) out of expected range at SOC={SOC:.4f}, T={cell_temp_C:.2f}°C")
 
-    return OCV, R0, R1, R2, C1, C2
\ No newline at end of file
+    return OCV, R0, R1, R2, C1, C2
+
+def build_battery_param_tables(BatteryData_SOH1, BatteryData_SOH2, BatteryData_SOH3):
+    # Stack every SOH bucket into one (bucket, SOC, T, 6) array per mode for get_battery_params_batch
+    temp_keys = ['T05', 'T15', 'T25', 'T35', 'T45', 'T55']
+    temp_vals = [5, 15, 25, 35, 45, 55]
+    SOC_grid = BatteryData_SOH1['CHARGE']['T05'][:, 0]
+    tables = {'SOC_grid': SOC_grid, 'Temp_grid': np.array(temp_vals, dtype=float)}
+    for mode in ['CHARGE', 'DISCHARGE']:
+        buckets = []
+        for BatteryData in [BatteryData_SOH1, BatteryData_SOH2, BatteryData_SOH3]:
+            Data_Temp = BatteryData[mode]
+            if not np.array_equal(Data_Temp['T05'][:, 0], SOC_grid):
+                raise ValueError('All SOH datasets must share the same SOC grid.')
+            buckets.append(np.stack([Data_Temp[temp][:, 1:7] for temp in temp_keys], axis=1))
+        tables[mode] = np.stack(buckets, axis=0)
+    return tables
+
+
+def _grid_interval(grid, x):
+    # Same interval choice as RegularGridInterpolator: edge intervals are reused for extrapolation
+    idx = np.searchsorted(grid, x) - 1
+    idx = np.clip(idx, 0, grid.size - 2)
+    frac = (x - grid[idx]) / (grid[idx + 1] - grid[idx])
+    return idx, frac
+
+
+def get_battery_params_batch(tables, SOC, cell_temp_C, mode, SOH, DCIR_aging_factor):
+    # Array version of get_battery_params: one bilinear pass returns all six parameters for all cells
+    if mode.upper() not in ('CHARGE', 'DISCHARGE'):
+        raise ValueError('Invalid mode. Use "CHARGE" or "DISCHARGE".')
+    table = tables[mode.upper()]
+
+    SOC = np.asarray(SOC, dtype=float)
+    cell_temp_C = np.asarray(cell_temp_C, dtype=float)
+    SOH = np.asarray(SOH, dtype=float)
+    bucket = np.where(SOH >= 0.9, 0, np.where(SOH >= 0.8, 1, 2))
+
+    i, s = _grid_interval(tables['SOC_grid'], SOC)
+    j, u = _grid_interval(tables['Temp_grid'], cell_temp_C)
+    s = s[..., None]
+    u = u[..., None]
+
+    params = (
+        table[bucket, i, j] * (1 - s) * (1 - u)
+        + table[bucket, i, j + 1] * (1 - s) * u
+        + table[bucket, i + 1, j] * s * (1 - u)
+        + table[bucket, i + 1, j + 1] * s * u
+    )
+    OCV, R0, R1, R2, C1, C2 = np.moveaxis(params, -1, 0)
+
+    # Apply aging
+    R0 = R0 * DCIR_aging_factor
+    R1 = R1 * DCIR_aging_factor
+    R2 = R2 * DCIR_aging_factor
+
+    return OCV, R0, R1, R2, C1, C2
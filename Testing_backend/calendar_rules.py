@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# Part of the on-disk file name; bump when the compiled layout changes
+CALENDAR_FORMAT_VERSION = 1
+
+# Compiled rule sets keyed on their content, shared by every run in the process
+_compiled_cache = {}
+
+
+def _compiled_path(cache_dir, key):
+    return os.path.join(cache_dir, f'calendar_v{CALENDAR_FORMAT_VERSION}_{key}.npy')
+
+
+def _load_compiled(path, key):
+    # Two plain .npy arrays back to back (no zip archive, which costs more to open than small rule
+    # sets take to compile): the drive cycle ids, then per rule its cycle and the three masks
+    with open(path, 'rb') as f:
+        dc_ids = np.load(f, allow_pickle=False)
+        table = np.load(f, allow_pickle=False)
+    return {
+        'key': key,
+        'dc_ids': dc_ids.tolist(),
+        'rule_dc': table[:, 0].astype(int),
+        'months': table[:, 1:14].astype(bool),
+        'weekdays': table[:, 14:21].astype(bool),
+        'dates': table[:, 21:53].astype(bool),
+    }
+
+
+def _save_compiled(path, compiled):
+    # Written to a temporary file and renamed, so concurrent runs never read a partial table
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.npy.tmp', dir=directory)
+    table = np.column_stack([compiled['rule_dc'], compiled['months'], compiled['weekdays'], compiled['dates']])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.array(compiled['dc_ids'], dtype=str), allow_pickle=False)
+            np.save(f, table.astype(np.int32), allow_pickle=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def compile_calendar_rules(rules, default_dc_id, cache_dir=None):
+    # Parses the month/day strings of every rule once into boolean masks:
+    # months[rule, 1..12], weekdays[rule, Mon..Sun] and dates[rule, 1..31]
+    # With a cache_dir (the setup cache directory) the compiled masks are also stored there under the
+    # same content key, so later runs and worker processes with the same rules skip the parsing.
+    key = hashlib.sha1(json.dumps([rules, default_dc_id], sort_keys=True).encode()).hexdigest()
+    compiled = _compiled_cache.get(key)
+    if compiled is not None:
+        return compiled
+    if cache_dir is not None and os.path.exists(_compiled_path(cache_dir, key)):
+        try:
+            compiled = _load_compiled(_compiled_path(cache_dir, key), key)
+            _compiled_cache[key] = compiled
+            return compiled
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: ignoring unreadable calendar cache entry {_compiled_path(cache_dir, key)} ({e}).")
+
+    dc_ids = [default_dc_id]
+    rule_dc = np.zeros(len(rules), dtype=int)
+    months = np.zeros((len(rules), 13), dtype=bool)
+    weekdays = np.zeros((len(rules), 7), dtype=bool)
+    dates = np.zeros((len(rules), 32), dtype=bool)
+
+    for r, rule in enumerate(rules):
+        dc_id = rule['driveCycleId'].strip()
+        if dc_id not in dc_ids:
+            dc_ids.append(dc_id)
+        rule_dc[r] = dc_ids.index(dc_id)
+
+        for m in rule['months'].split(','):
+            month = int(m)
+            if 1 <= month <= 12:
+                months[r, month] = True
+
+        days_or_dates = [d.strip().lower().capitalize() for d in rule['daysOrDates'].split(',')]
+        if rule['filterType'] == 'weekday':
+            for d in days_or_dates:
+                if d in WEEKDAYS:
+                    weekdays[r, WEEKDAYS.index(d)] = True
+        elif rule['filterType'] == 'date':
+            for d in days_or_dates:
+                if d.isdigit() and 1 <= int(d) <= 31: # Handle non-digits
+                    dates[r, int(d)] = True
+
+    compiled = {
+        'key': key,
+        'dc_ids': dc_ids,
+        'rule_dc': rule_dc,
+        'months': months,
+        'weekdays': weekdays,
+        'dates': dates,
+    }
+    _compiled_cache[key] = compiled
+    if cache_dir is not None:
+        _save_compiled(_compiled_path(cache_dir, key), compiled)
+    return compiled
+
+
+def resolve_calendar(compiled, start_date_str, num_days):
+    # Index into compiled['dc_ids'] for every day; the first matching rule wins, as in the
+    # original per-day scan, so rules are applied last-to-first over the whole date range
+    days = np.datetime64(start_date_str, 'D') + np.arange(num_days)
+    month = (days.astype('datetime64[M]').astype(int) % 12) + 1
+    date_day = (days - days.astype('datetime64[M]')).astype(int) + 1
+    weekday = (days.astype(int) + 3) % 7 # 1970-01-01 was a Thursday
+
+    day_dc = np.zeros(num_days, dtype=int)
+    for r in range(len(compiled['rule_dc']) - 1, -1, -1):
+        match = compiled['months'][r, month] & (compiled['weekdays'][r, weekday] | compiled['dates'][r, date_day])
+        day_dc[match] = compiled['rule_dc'][r]
+    return day_dc, days
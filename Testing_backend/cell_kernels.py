@@ -0,0 +1,86 @@
+import numpy as np
+from state_update import calculate_state_update
+from reversible_heat import entropic_table
+
+# numba is optional: without it the NumPy backend is used
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ['auto', 'numpy', 'numba', 'python']
+
+
+def _fused_loop(I_cells, dt, capacity, coulombic_efficiency, SOC, SOH, Temp, V_term, R0,
+                energy_throughput, Qgen_cumulative, du_dt_table,
+                next_SOC, q_irr, q_rev, q_gen, energy_step, energy_total, Qgen_total):
+    # One pass per cell: SOC update, irreversible and entropic heat, energy moved, and the
+    # cumulative energy/Qgen after this step (written to new arrays so a rejected step leaves
+    # the running totals untouched). Plain Python here; compiled with numba.njit when available.
+    last = du_dt_table.shape[0] - 1
+    for i in range(I_cells.shape[0]):
+        I = I_cells[i]
+        charge_step = I * dt / (capacity[i] * SOH[i] * 3600)
+        if I < 0:
+            charge_step = charge_step * coulombic_efficiency
+        soc = min(max(SOC[i] - charge_step, 0.0), 1.0)
+        next_SOC[i] = soc
+
+        # Entropic heat uses the SOC at the start of the step, as calculate_state_update does,
+        # interpolated in the uniform dU/dT(SOC) table
+        pos = min(max(SOC[i], 0.0), 1.0) * last
+        j = min(int(pos), last - 1)
+        du_dt = du_dt_table[j] + (pos - j) * (du_dt_table[j + 1] - du_dt_table[j])
+        q_r = Temp[i] * (-I) * du_dt
+        q_i = I * I * R0[i]
+        q_rev[i] = q_r
+        q_irr[i] = q_i
+        q_gen[i] = q_i + q_r
+        Qgen_total[i] = Qgen_cumulative[i] + (q_i + q_r)
+
+        e = abs(I * V_term[i] * dt) / (3600 * 1000)
+        energy_step[i] = e
+        energy_total[i] = energy_throughput[i] + e
+
+
+_fused_numba = numba.njit(cache=True)(_fused_loop) if numba is not None else None
+
+
+def resolve_backend(backend='auto'):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown kernel backend: {backend}. Use one of {BACKENDS}.")
+    if backend == 'auto':
+        return 'numba' if numba is not None else 'numpy'
+    if backend == 'numba' and numba is None:
+        raise ValueError("Kernel backend 'numba' requested but numba is not installed.")
+    return backend
+
+
+def fused_cell_update(backend, I_cells, dt, capacity, coulombic_efficiency, SOC, SOH, Temp, V_term, R0,
+                      energy_throughput, Qgen_cumulative, heat=True, energy=True, entropic=None):
+    # Returns next_SOC, q_irr, q_rev, q_gen, energy_step and the cumulative energy_throughput/Qgen
+    # after the step (same dtypes as the running totals). The NumPy backend skips heat/energy
+    # when not needed (returned as None); the loop backends always compute everything.
+    # capacity is one value or per cell; entropic is the dU/dT table from
+    # reversible_heat.entropic_table (built-in fit if None).
+    if entropic is None:
+        entropic = entropic_table()
+    if backend == 'numpy':
+        next_SOC, q_irr, q_rev, q_gen, energy_step = calculate_state_update(
+            I_cells, dt, capacity, coulombic_efficiency, SOC, SOH, Temp, V_term, R0, heat=heat, energy=energy,
+            entropic=entropic
+        )
+        Qgen_total = (Qgen_cumulative + q_gen).astype(Qgen_cumulative.dtype) if heat else None
+        energy_total = (energy_throughput + energy_step).astype(energy_throughput.dtype) if energy else None
+        return next_SOC, q_irr, q_rev, q_gen, energy_step, energy_total, Qgen_total
+
+    n = len(I_cells)
+    next_SOC, q_irr, q_rev, q_gen, energy_step = (np.empty(n) for _ in range(5))
+    energy_total = np.empty_like(energy_throughput)
+    Qgen_total = np.empty_like(Qgen_cumulative)
+    kernel = _fused_numba if backend == 'numba' else _fused_loop
+    capacity = np.ascontiguousarray(np.broadcast_to(np.asarray(capacity, dtype=float), (n,)))
+    kernel(np.ascontiguousarray(I_cells, dtype=float), float(dt), capacity, float(coulombic_efficiency),
+           SOC, SOH, Temp, V_term, R0, energy_throughput, Qgen_cumulative, entropic['du_dt'],
+           next_SOC, q_irr, q_rev, q_gen, energy_step, energy_total, Qgen_total)
+    return next_SOC, q_irr, q_rev, q_gen, energy_step, energy_total, Qgen_total
@@ -0,0 +1,25 @@
+import h5py
+
+CHECKPOINT_GROUP = 'checkpoint'
+
+
+def write_checkpoint(h5_file, state, attrs):
+    # Overwrites the single checkpoint group of an open results file: per-cell state arrays as
+    # datasets, scalars (step position, counters, clocks) as attributes
+    group = h5_file.require_group(CHECKPOINT_GROUP)
+    for key, value in state.items():
+        if key in group:
+            group[key][...] = value
+        else:
+            group.create_dataset(key, data=value)
+    for key, value in attrs.items():
+        group.attrs[key] = value
+    h5_file.flush()
+
+
+def read_checkpoint(h5_path):
+    with h5py.File(h5_path, 'r') as f:
+        if CHECKPOINT_GROUP not in f:
+            raise ValueError(f"{h5_path} has no checkpoint to resume from.")
+        group = f[CHECKPOINT_GROUP]
+        return {key: group[key][...] for key in group}, dict(group.attrs)
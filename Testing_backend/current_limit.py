@@ -0,0 +1,20 @@
+import numpy as np
+
+def calculate_limit_current(V_term_zero, V_term_request, I_request, V_limit, charge):
+    # For a fixed step every cell's terminal voltage is affine in the module current, so the
+    # largest fraction of I_request that keeps all cells inside V_limit follows from the
+    # voltages at zero current and at the requested current.
+    # Voltages are (cells,) for one run or (scenarios, cells) for a batch, with I_request, V_limit
+    # and charge (True for CHARGE) one value per run or scenario. Runs with no violating cell keep
+    # their requested current; a nan V_limit is never violated.
+    sign = np.where(charge, 1.0, -1.0)[..., None]
+    V_limit = np.asarray(V_limit, dtype=float)[..., None]
+    excess_zero = sign * (V_term_zero - V_limit)
+    excess_request = sign * (V_term_request - V_limit)
+
+    violating = excess_request > 0
+    # Cells already past the limit at zero current allow no current at all
+    slope = np.where(violating & (excess_zero < 0), excess_request - excess_zero, 1.0)
+    fraction = np.where(excess_zero >= 0, 0.0, -excess_zero / slope)
+    fraction = np.clip(np.min(np.where(violating, fraction, np.inf), axis=-1), 0.0, 1.0)
+    return np.where(fraction == 0.0, 0.0, fraction * I_request)
@@ -0,0 +1,180 @@
+import numpy as np
+from calendar_rules import compile_calendar_rules, resolve_calendar
+
+
+def _step_current(step, nominal_V, capacity, warned):
+    unit = step['unit']
+    value = float(step['value'])
+    if unit == 'A':
+        return value
+    if unit == 'W':
+        return value / nominal_V
+    if unit == 'C':
+        return value * capacity
+    if unit == 'V':
+        if not warned['V']:
+            print("Warning: Skipping constant V step (not supported). This warning will not repeat.")
+            warned['V'] = True
+        return None
+    if not warned['unit']:
+        print(f"Warning: Unknown unit {unit}, skipping. This warning will not repeat.")
+        warned['unit'] = True
+    return None
+
+
+def resolve_drive_cycle_segments(dc, sub_cycles, nominal_V, capacity, warned):
+    # Run-length form of one day: (start_time, duration, current, is_dynamic) per segment,
+    # with the idle time up to 86400 s appended as a final non-dynamic segment
+    durations = []
+    currents = []
+    dynamic = []
+    for segment in dc['segments']:
+        sub = sub_cycles.get(segment['subCycleId'])
+        if not sub:
+            continue
+        for _ in range(segment['repetitions']):
+            for step in sub['steps']:
+                total_duration = step['duration'] * step.get('repetitions', 1)
+                if total_duration == 0:
+                    continue
+                I = _step_current(step, nominal_V, capacity, warned)
+                if I is None:
+                    continue
+                durations.append(total_duration)
+                currents.append(I)
+                dynamic.append(bool(step['isDynamic']))
+
+    day_duration = float(np.sum(durations)) if durations else 0.0
+    if day_duration < 86400:
+        durations.append(86400 - day_duration)
+        currents.append(0.0)
+        dynamic.append(False)
+
+    durations = np.array(durations, dtype=float)
+    return {
+        'start_time': np.concatenate([[0.0], np.cumsum(durations)[:-1]]),
+        'duration': durations,
+        'current': np.array(currents, dtype=float),
+        'is_dynamic': np.array(dynamic, dtype=bool),
+    }
+
+
+def expand_segments(segments, dynamic_dt):
+    # Solver steps for one day: dynamic segments split into dynamic_dt sub-steps plus a remainder,
+    # everything else kept as a single step
+    n_full = np.where(segments['is_dynamic'], (segments['duration'] / dynamic_dt).astype(int), 0)
+    remainder = np.where(segments['is_dynamic'], segments['duration'] % dynamic_dt, segments['duration'])
+    has_remainder = remainder > 0
+
+    counts = n_full + has_remainder
+    step_dt = np.repeat(np.full(len(counts), float(dynamic_dt)), counts)
+    step_current = np.repeat(segments['current'], counts)
+    # The last sub-step of a segment carries its remainder (or the whole non-dynamic duration)
+    last = np.cumsum(counts)[has_remainder] - 1
+    step_dt[last] = remainder[has_remainder]
+    return step_dt, step_current
+
+
+def build_drive_profile(drive_config, start_date_str='2025-01-01', num_days=365, nominal_V=3.7, capacity=5.0, dynamic_dt=60.0,
+                        cache_dir=None):
+    sub_cycles = {sc['id']: sc for sc in drive_config['subCycles']}
+    drive_cycles = {dc['id']: dc for dc in drive_config['driveCycles']}
+
+    default_dc_id = drive_config['defaultDriveCycleId']
+    if not default_dc_id or default_dc_id not in drive_cycles:
+        default_dc_id = list(drive_cycles.keys())[0]
+
+    compiled = compile_calendar_rules(drive_config['calendarRules'], default_dc_id, cache_dir)
+    day_dc, dates = resolve_calendar(compiled, start_date_str, num_days)
+
+    warned = {'V': False, 'unit': False}
+    cycles = []
+    # Each drive cycle is resolved and expanded once, however many days use it
+    dc_cycle = np.full(len(compiled['dc_ids']), -1, dtype=int)
+    for i, dc_id in enumerate(compiled['dc_ids']):
+        dc = drive_cycles.get(dc_id)
+        if not dc or not np.any(day_dc == i):
+            continue
+        segments = resolve_drive_cycle_segments(dc, sub_cycles, nominal_V, capacity, warned)
+        step_dt, step_current = expand_segments(segments, dynamic_dt)
+        dc_cycle[i] = len(cycles)
+        cycles.append({'id': dc_id, 'segments': segments, 'step_dt': step_dt, 'step_current': step_current})
+    day_cycle = dc_cycle[day_dc]
+
+    for day in np.nonzero(day_cycle < 0)[0]:
+        print(f"Warning: No DC for day {dates[day]}, skipping.")
+
+    return {
+        'start_date': start_date_str,
+        'num_days': num_days,
+        'dynamic_dt': dynamic_dt,
+        'day_cycle': day_cycle,
+        'cycles': cycles,
+    }
+
+
+def drive_profile_steps(profile):
+    # Number of solver steps per day (0 for skipped days)
+    steps_per_cycle = np.array([len(c['step_dt']) for c in profile['cycles']] + [0])
+    return steps_per_cycle[profile['day_cycle']]
+
+
+def drive_profile_grid(profile):
+    # Solver steps and simulated seconds of the whole profile, without expanding it
+    steps = int(np.sum(drive_profile_steps(profile)))
+    cycle_duration = np.array([np.sum(c['step_dt']) for c in profile['cycles']] + [0.0])
+    return steps, float(np.sum(cycle_duration[profile['day_cycle']]))
+
+
+def drive_profile_median_dt(profile):
+    # Median solver step (s) of the whole profile, each cycle's steps counted once per day it runs
+    days = profile['day_cycle']
+    runs = np.bincount(days[days >= 0], minlength=len(profile['cycles']))
+    if not np.any(runs):
+        return 0.0
+    step_dt = np.concatenate([c['step_dt'] for c in profile['cycles']])
+    weight = np.concatenate([np.full(len(c['step_dt']), n) for c, n in zip(profile['cycles'], runs)])
+    order = np.argsort(step_dt)
+    cumulative = np.cumsum(weight[order])
+    return float(step_dt[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+
+def iter_drive_profile(profile, chunk_days=30):
+    # Solver steps in chunks of chunk_days days, expanded only when they are reached: yields
+    # (time, current) with one more time than currents, step k running from time[k] to time[k + 1]
+    # at current[k]. Chunk by chunk this is exactly the grid of drive_profile_arrays(profile), where
+    # each step takes the current of the sample it starts from (0 A for the first step).
+    last_time = 0.0
+    last_current = 0.0
+    for day_start in range(0, profile['num_days'], chunk_days):
+        days = profile['day_cycle'][day_start:day_start + chunk_days]
+        days = days[days >= 0]
+        if len(days) == 0:
+            continue
+        step_dt = [profile['cycles'][c]['step_dt'] for c in days]
+        step_current = [profile['cycles'][c]['step_current'] for c in days]
+        time_chunk = np.cumsum(np.concatenate([[last_time]] + step_dt))
+        sample_current = np.concatenate([[last_current]] + step_current)
+        last_time = time_chunk[-1]
+        last_current = sample_current[-1]
+        yield time_chunk, sample_current[:-1]
+
+
+def drive_profile_times(profile, steps):
+    # Simulated time at the end of the given (sorted) step counts, read chunk by chunk
+    steps = np.asarray(steps)
+    out = np.zeros(len(steps))
+    offset = 0
+    for time_chunk, current_chunk in iter_drive_profile(profile):
+        n = len(current_chunk)
+        inside = (steps >= offset) & (steps <= offset + n)
+        out[inside] = time_chunk[steps[inside] - offset]
+        offset += n
+    return out
+
+
+def drive_profile_arrays(profile):
+    valid = profile['day_cycle'][profile['day_cycle'] >= 0]
+    step_dt = [np.array([0.0])] + [profile['cycles'][c]['step_dt'] for c in valid]
+    step_current = [np.array([0.0])] + [profile['cycles'][c]['step_current'] for c in valid]
+    return np.cumsum(np.concatenate(step_dt)), np.concatenate(step_current)
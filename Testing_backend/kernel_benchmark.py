@@ -0,0 +1,71 @@
+# Testing_backend/kernel_benchmark.py
+# Micro-benchmark of the per-cell state update: the separate NumPy functions used before the
+# fused kernel, the fused update on each available backend, for a range of pack sizes.
+import time
+import argparse
+import numpy as np
+from next_soc import calculate_next_soc
+from reversible_heat import calculate_reversible_heat
+from cell_kernels import fused_cell_update, numba
+
+
+def make_inputs(n_cells, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        'I_cells': rng.uniform(-20, 20, n_cells),
+        'SOC': rng.uniform(0, 1, n_cells),
+        'SOH': rng.uniform(0.8, 1, n_cells),
+        'Temp': rng.uniform(290, 320, n_cells),
+        'V_term': rng.uniform(3.0, 4.2, n_cells),
+        'R0': rng.uniform(0.015, 0.03, n_cells),
+        'energy_throughput': np.zeros(n_cells, dtype='float32'),
+        'Qgen_cumulative': np.zeros(n_cells, dtype='float32'),
+    }
+
+
+def separate_update(x, dt=60.0, capacity=5.0, coulombic_efficiency=1.0):
+    # The unfused sequence: one pass per quantity plus the in-place running totals
+    next_SOC = calculate_next_soc(x['I_cells'], dt, capacity, x['SOC'], coulombic_efficiency, x['SOH'])
+    q_irr = x['I_cells'] ** 2 * x['R0']
+    q_rev = calculate_reversible_heat(x['Temp'], x['I_cells'], x['SOC'])
+    q_gen = q_irr + q_rev
+    energy = np.abs(x['I_cells'] * x['V_term'] * dt) / (3600 * 1000)
+    x['Qgen_cumulative'] += q_gen
+    x['energy_throughput'] += energy
+    return next_SOC
+
+
+def fused_update(backend, x, dt=60.0, capacity=5.0, coulombic_efficiency=1.0):
+    result = fused_cell_update(backend, x['I_cells'], dt, capacity, coulombic_efficiency, x['SOC'], x['SOH'], x['Temp'],
+                               x['V_term'], x['R0'], x['energy_throughput'], x['Qgen_cumulative'])
+    x['energy_throughput'] = result[5]
+    x['Qgen_cumulative'] = result[6]
+    return result[0]
+
+
+def time_call(fn, repeats):
+    fn() # warm-up (numba compiles on the first call)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-cell state update backends.')
+    parser.add_argument('--cells', type=int, nargs='+', default=[18, 1000, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--python', action='store_true', help='Also time the uncompiled loop (slow)')
+    args = parser.parse_args()
+
+    backends = ['numpy'] + (['numba'] if numba is not None else []) + (['python'] if args.python else [])
+    if numba is None:
+        print("numba not installed; timing the NumPy backends only.")
+    print(f"{'cells':>8}  {'separate (us)':>14}" + ''.join(f"  {'fused ' + b + ' (us)':>20}" for b in backends))
+    for n_cells in args.cells:
+        x = make_inputs(n_cells)
+        row = [time_call(lambda: separate_update(x), args.repeats)]
+        for backend in backends:
+            repeats = max(1, args.repeats // 50) if backend == 'python' else args.repeats
+            row.append(time_call(lambda: fused_update(backend, x), repeats))
+        print(f"{n_cells:>8}  {row[0] * 1e6:>14.1f}" + ''.join(f"  {t * 1e6:>20.1f}" for t in row[1:]))
@@ -1,85 +1,117 @@
 # Updated main.py to handle partial data from early stop
-import h5py
+import json
+import argparse
+import datetime
 import matplotlib.pyplot as plt
 import numpy as np
 from data_processor import create_setup_from_json
-from electrical_solver import run_electrical_solver
+from electrical_solver import run_electrical_solver, resume_electrical_solver
+from solver_observers import ProgressReporter, LivePlotObserver
+from results_reader import ResultsReader
+
+
+def month_ticks(start_date, span_days):
+    # Day offsets and labels of the month starts in the run (every 3rd/12th month on long runs);
+    # None for runs too short to show a month, which keep the default day ticks
+    start = datetime.date.fromisoformat(start_date)
+    step = 1 if span_days <= 400 else 3 if span_days <= 1200 else 12
+    multi_year = (start + datetime.timedelta(days=span_days)).year != start.year
+    ticks, labels = [], []
+    year, month = start.year, start.month
+    while True:
+        day = (datetime.date(year, month, 1) - start).days
+        if day > span_days:
+            break
+        if day >= 0 and (month - 1) % step == 0:
+            ticks.append(day)
+            labels.append(datetime.date(year, month, 1).strftime('%b %Y' if multi_year else '%b'))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (ticks, labels) if len(ticks) >= 2 else None
+
+
+def date_rule_day_spans(drive_profile, rules, default_dc_id):
+    # (start, end) day spans driven with a cycle that only date rules assign (holidays, vacations)
+    date_ids = {rule['driveCycleId'].strip() for rule in rules if rule['filterType'] == 'date'}
+    date_ids -= {rule['driveCycleId'].strip() for rule in rules if rule['filterType'] != 'date'} | {default_dc_id}
+    cycle_ids = np.array([cycle['id'] for cycle in drive_profile['cycles']] + [''])
+    special = np.isin(cycle_ids[drive_profile['day_cycle']], list(date_ids)).astype(int)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], special, [0]])))
+    return list(zip(edges[::2], edges[1::2]))
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help='Continue from the last checkpoint in the results file')
+    parser.add_argument('--no-cache', action='store_true', help='Rebuild the setup instead of loading it from .setup_cache')
+    args = parser.parse_args()
     # Paths to JSON files
     pack_json = 'pack_config.json'
     drive_json = 'drive_config.json'
     sim_json = 'model_config.json'
     print("Loading and processing configs...")
-    setup_data = create_setup_from_json(pack_json, drive_json, sim_json)
-    I_module = setup_data['I_module']  # Get before simulation
-    print("Running simulation...")
-    h5_path = run_electrical_solver(setup_data)
+    setup_data = create_setup_from_json(pack_json, drive_json, sim_json,
+                                        cache_dir=None if args.no_cache else '.setup_cache')
+    observers = [ProgressReporter(), LivePlotObserver()]
+    if args.resume:
+        print("Resuming simulation from checkpoint...")
+        h5_path = resume_electrical_solver(setup_data, observers=observers)
+    else:
+        print("Running simulation...")
+        h5_path = run_electrical_solver(setup_data, observers=observers)
     print("\nSimulation Complete! History saved to", h5_path)
-    # Load from HDF5 and display graph
-    with h5py.File(h5_path, 'r') as f:
-        dt = f['dt'][:]
-        soc_cell0 = f['SOC'][0, :]
-        vterm_cell0 = f['Vterm'][0, :]
-        qgen_cell0 = f['Qgen'][0, :]
-    # Find effective end (last non-zero dt index +1)
-    effective_end = np.where(dt > 0)[0][-1] + 1 if np.any(dt > 0) else 0
-    dt = dt[:effective_end]
-    soc_cell0 = soc_cell0[:effective_end]
-    vterm_cell0 = vterm_cell0[:effective_end]
-    qgen_cell0 = qgen_cell0[:effective_end]
-    I_module = I_module[:effective_end]
-    time_cum = np.cumsum(dt)
-    time_days = time_cum / 86400  # Convert to days
+    # Plots read about 2000 min/max/mean points per channel from the results pyramid, whatever the
+    # run length: the first recorded cell's series and the module current
+    with ResultsReader(h5_path) as results:
+        cell = int(results.recorded_cells('SOC')[0])
+        cell_label = results.label(cell)
+        soc = results.overview('SOC', cell)
+        vterm = results.overview('Vterm', cell)
+        qgen = results.overview('Qgen', cell)
+        # Current actually applied per solver step (clamped, and on the adaptive grid if enabled)
+        current = results.overview('I_module')
+        # Samples end at these simulated times; a run stopped early has fewer than planned
+        span_days = results.sample_time('dt')[-1] / 86400 if results.completed_steps else 0.0
     fig, axs = plt.subplots(4, 1, figsize=(14, 12), sharex=True)
-    fig.suptitle('Simulation Results for Cell 0 Over 1 Year (Calendar Time)', fontsize=16)
-    # SOC plot
-    axs[0].plot(time_days, soc_cell0, color='blue', label='SOC')
-    axs[0].set_ylabel('State of Charge (SOC)', fontsize=12)
-    axs[0].set_title('SOC Over Time', fontsize=14)
-    axs[0].grid(True, linestyle='--', alpha=0.7)
+    fig.suptitle(f'Simulation Results for Cell {cell_label} (Calendar Time)', fontsize=16)
+    panels = [
+        (soc, 'blue', 'SOC', 'State of Charge (SOC)', 'SOC Over Time'),
+        (vterm, 'green', 'Terminal Voltage', 'Terminal Voltage (V)', 'Terminal Voltage Over Time'),
+        (qgen, 'red', 'Heat Generation', 'Heat Generation (W)', 'Heat Generation Over Time'),
+        (current, 'purple', 'Module Current', 'Current (A)', 'Module Current Over Time'),
+    ]
+    for ax, (view, color, label, ylabel, title) in zip(axs, panels):
+        days = view['time'] / 86400
+        # Mean per point, with the min/max envelope of the samples it stands for
+        ax.plot(days, view['mean'], color=color, label=label)
+        if np.any(view['min'] != view['max']):
+            ax.fill_between(days, view['min'], view['max'], color=color, alpha=0.25, linewidth=0)
+        ax.set_ylabel(ylabel, fontsize=12)
+        ax.set_title(title, fontsize=14)
+        ax.grid(True, linestyle='--', alpha=0.7)
     axs[0].set_ylim(0, 1)  # Force full SOC range
-    axs[0].legend(loc='upper right')
-    # Terminal Voltage plot
-    axs[1].plot(time_days, vterm_cell0, color='green', label='Terminal Voltage')
-    axs[1].set_ylabel('Terminal Voltage (V)', fontsize=12)
-    axs[1].set_title('Terminal Voltage Over Time', fontsize=14)
-    axs[1].grid(True, linestyle='--', alpha=0.7)
     axs[1].set_ylim(0, 5)  # Reasonable voltage range
-    axs[1].legend(loc='upper right')
-    # Heat Generation plot
-    axs[2].plot(time_days, qgen_cell0, color='red', label='Heat Generation')
-    axs[2].set_ylabel('Heat Generation (W)', fontsize=12)
-    axs[2].set_title('Heat Generation Over Time', fontsize=14)
-    axs[2].grid(True, linestyle='--', alpha=0.7)
     # Safe ylim handling
-    if len(qgen_cell0) > 0:
-        q_max = np.max(qgen_cell0)
-        axs[2].set_ylim(-1, q_max * 1.1 if q_max > 0 else 1)  # Use np.max
+    if len(qgen['max']) > 0:
+        q_max = np.max(qgen['max'])
+        axs[2].set_ylim(-1, q_max * 1.1 if q_max > 0 else 1)
     else:
         axs[2].set_ylim(-1, 1)  # Default if empty
-    axs[2].legend(loc='upper right')
-    # Module Current plot (added for clarity on activity)
-    axs[3].plot(time_days, I_module, color='purple', label='Module Current')
     axs[3].set_xlabel('Time (Days)', fontsize=12)
-    axs[3].set_ylabel('Current (A)', fontsize=12)
-    axs[3].set_title('Module Current Over Time', fontsize=14)
-    axs[3].grid(True, linestyle='--', alpha=0.7)
-    axs[3].legend(loc='upper right')
-    # Month labels
-    month_starts = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
-    month_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-    axs[3].set_xticks(month_starts)
-    axs[3].set_xticklabels(month_labels, rotation=45, ha='right')
-    # Shade vacation periods (from calendarRules)
-    vacation_periods = [  # Approximate day ranges based on rules
-        (90, 92), (101, 102), # Apr 1-2, 13-14
-        (181, 186), (209, 210), # Jul 3-5,29-30
-    ]
-    for start, end in vacation_periods:
+    # Month labels from the drive profile's start date, for however long the run was
+    ticks = month_ticks(setup_data['drive_profile']['start_date'], span_days)
+    if ticks is not None:
+        axs[3].set_xticks(ticks[0])
+        axs[3].set_xticklabels(ticks[1], rotation=45, ha='right')
+    # Shade the days the calendar rules assign a date-specific (vacation/holiday) cycle
+    with open(drive_json, 'r') as f:
+        drive = json.load(f)
+    vacation_periods = date_rule_day_spans(setup_data['drive_profile'], drive['calendarRules'],
+                                           drive['defaultDriveCycleId'])
+    for i, (start, end) in enumerate(vacation_periods):
         for ax in axs:
-            ax.axvspan(start, end, color='yellow', alpha=0.3, label='Vacation' if start == 90 else None)
-    axs[0].legend(loc='upper right') # Update legend if shaded
+            ax.axvspan(start, end, color='yellow', alpha=0.3, label='Vacation' if i == 0 else None)
+    for ax in axs:
+        ax.legend(loc='upper right')
     plt.tight_layout(rect=[0, 0.03, 1, 0.95])
     plt.savefig('simulation_plot.png') # Save to file for zoom/view
-    plt.show()
\ No newline at end of file
+    plt.show()
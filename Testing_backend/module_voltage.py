@@ -1,18 +1,13 @@
 import numpy as np
 
-def calculate_module_voltage(cells, V_parallel_matrix, I_module, R_s, t, V_terminal_module_matrix):
-    parallel_groups = sorted(set(cell['parallel_group'] for cell in cells))
-    num_series_connections = len(parallel_groups) - 1
+def calculate_module_voltage(topology, V_parallel, I_module_current, R_s):
+    # The parallel groups are all in series, each joined by one R_s busbar, and every cell of a group
+    # shares V_parallel, so the representative cells and series count come straight from the topology.
+    # V_parallel is (cells,) for one run, or (scenarios, cells) with I_module_current (scenarios,)
+    # for a batch.
+    n_series = topology['n_groups']
+    V_sum_parallel_groups = np.sum(V_parallel[..., topology['group_first_cell']], axis=-1)
 
-    V_sum_parallel_groups = 0.0
-    for group_id in parallel_groups:
-        for cell_idx, cell in enumerate(cells):
-            if cell['parallel_group'] == group_id:
-                V_sum_parallel_groups += V_parallel_matrix[cell_idx, t]
-                break
+    V_terminal_module = V_sum_parallel_groups - np.asarray(I_module_current) * n_series * R_s
 
-    V_terminal_module = V_sum_parallel_groups - I_module[t] * (num_series_connections + 1) * R_s
-
-    V_terminal_module_matrix[t] = V_terminal_module
-
-    return V_terminal_module_matrix
\ No newline at end of file
+    return V_terminal_module
\ No newline at end of file
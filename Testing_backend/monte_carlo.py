@@ -0,0 +1,302 @@
+# Testing_backend/monte_carlo.py
+# Monte-Carlo study of cell-to-cell manufacturing spread. Per-cell capacity, R0 and DCIR factors are
+# sampled from the distributions in the 'variation' section of pack_config.json, realizations are
+# run in batches through the batched solver (batches spread over worker processes), and only
+# streaming statistics over realizations are kept, so memory does not grow with their number.
+import os
+import copy
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import h5py
+from setup_cache import create_setup_cached, DEFAULT_CACHE_DIR
+from batch_solver import run_batched_solver
+from drive_profile import drive_profile_grid, drive_profile_times
+from solver_observers import SolverObserver
+
+# Sampled quantity -> scenario field of the batched solver (all are multipliers with mean ~1)
+VARIED_FIELDS = {'capacity': 'capacity_factor', 'R0': 'R0_factor', 'DCIR': 'DCIR_AgingFactor'}
+DISTRIBUTIONS = ['normal', 'lognormal', 'uniform']
+DEFAULT_VARIATION = {
+    'realizations': 100,
+    'batch_size': 50,
+    'seed': 0,
+    'stats_decimation': 60, # solver steps per statistics sample
+    'sketch_bins': 100, # histogram bins per statistic for the percentiles
+    'percentiles': [5, 50, 95],
+    'parameters': {},
+}
+# Factors are kept physical even for wide normal distributions
+MIN_FACTOR = 0.05
+
+
+def sample_factors(parameter, n_realizations, n_cells, rng):
+    # parameter: {"distribution": "normal", "mean": 1.0, "std": 0.02}, {"distribution": "lognormal",
+    # "sigma": 0.05} (median 1) or {"distribution": "uniform", "low": 0.95, "high": 1.05}
+    distribution = parameter.get('distribution', 'normal')
+    size = (n_realizations, n_cells)
+    if distribution == 'normal':
+        factors = rng.normal(parameter.get('mean', 1.0), parameter.get('std', 0.0), size)
+    elif distribution == 'lognormal':
+        factors = rng.lognormal(np.log(parameter.get('median', 1.0)), parameter.get('sigma', 0.0), size)
+    elif distribution == 'uniform':
+        factors = rng.uniform(parameter.get('low', 1.0), parameter.get('high', 1.0), size)
+    else:
+        raise ValueError(f"Unknown distribution '{distribution}'. Use one of {DISTRIBUTIONS}.")
+    return np.maximum(factors, MIN_FACTOR)
+
+
+def sample_scenarios(variation, setup_data, n_realizations, rng):
+    n_cells = setup_data['topology']['n_cells']
+    scenarios = [{} for _ in range(n_realizations)]
+    for name, parameter in variation['parameters'].items():
+        if name not in VARIED_FIELDS:
+            raise ValueError(f"Unsupported varied parameter: {name}. Use one of {list(VARIED_FIELDS)}.")
+        factors = sample_factors(parameter, n_realizations, n_cells, rng)
+        if name == 'DCIR':
+            # Spread on top of the configured initial aging factor
+            factors = factors * setup_data['initial_state']['DCIR_AgingFactor']
+        for scenario, values in zip(scenarios, factors):
+            scenario[VARIED_FIELDS[name]] = values
+    return scenarios
+
+
+class StreamingStats:
+    # Statistics over realizations for every sample time of one metric: count, running mean and M2
+    # (batches merged with Chan's update), exact min/max, and a fixed-bin histogram per element as the
+    # percentile sketch. Bin edges are set by the first batch (its range widened by half on each
+    # side, so later batches rarely fall outside); values outside go into the edge bins and are
+    # counted in 'clamped'. Percentiles are within one bin width ('resolution') of the empirical
+    # quantile wherever nothing was clamped, and always clipped to the exact min/max.
+    def __init__(self, n_samples, shape=(), bins=100, lo=None, hi=None):
+        full = (n_samples,) + tuple(shape)
+        self.bins = bins
+        self.count = np.zeros(n_samples, dtype=np.int64)
+        self.mean = np.zeros(full)
+        self.M2 = np.zeros(full)
+        self.min = np.full(full, np.inf)
+        self.max = np.full(full, -np.inf)
+        self.hist = np.zeros(full + (bins,), dtype=np.int32)
+        self.clamped = np.zeros(full, dtype=np.int64)
+        self.lo = np.full(full, np.nan) if lo is None else lo.copy()
+        self.hi = np.full(full, np.nan) if hi is None else hi.copy()
+
+    def update(self, index, samples):
+        # samples: (realizations, *shape) values for sample time `index`
+        samples = np.asarray(samples, dtype=float)
+        n = samples.shape[0]
+        batch_mean = samples.mean(axis=0)
+        batch_M2 = np.sum((samples - batch_mean) ** 2, axis=0)
+        n_a = self.count[index]
+        total = n_a + n
+        delta = batch_mean - self.mean[index]
+        self.mean[index] += delta * n / total
+        self.M2[index] += batch_M2 + delta ** 2 * n_a * n / total
+        self.count[index] = total
+        self.min[index] = np.minimum(self.min[index], samples.min(axis=0))
+        self.max[index] = np.maximum(self.max[index], samples.max(axis=0))
+
+        unset = np.isnan(self.lo[index])
+        if np.any(unset):
+            lo, hi = samples.min(axis=0), samples.max(axis=0)
+            pad = 0.5 * (hi - lo) + 1e-6 * np.maximum(np.abs(lo), 1.0)
+            self.lo[index] = np.where(unset, lo - pad, self.lo[index])
+            self.hi[index] = np.where(unset, hi + pad, self.hi[index])
+        lo, hi = self.lo[index], self.hi[index]
+        self.clamped[index] += np.sum((samples < lo) | (samples > hi), axis=0)
+        bin_index = np.clip(((samples - lo) / (hi - lo) * self.bins).astype(int), 0, self.bins - 1)
+        n_elements = lo.size
+        flat = (np.arange(n_elements) * self.bins + bin_index.reshape(n, n_elements)).ravel()
+        self.hist[index] += np.bincount(flat, minlength=n_elements * self.bins).reshape(lo.shape + (self.bins,)).astype(np.int32)
+
+    def merge(self, other):
+        if not (np.array_equal(self.lo, other.lo, equal_nan=True) and np.array_equal(self.hi, other.hi, equal_nan=True)):
+            raise ValueError("Statistics with different histogram ranges cannot be merged.")
+        n_a = self.count.reshape((-1,) + (1,) * (self.mean.ndim - 1))
+        n_b = other.count.reshape(n_a.shape)
+        total = np.maximum(n_a + n_b, 1)
+        delta = other.mean - self.mean
+        self.mean += delta * n_b / total
+        self.M2 += other.M2 + delta ** 2 * n_a * n_b / total
+        self.count += other.count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.hist += other.hist
+        self.clamped += other.clamped
+
+    def std(self):
+        n = self.count.reshape((-1,) + (1,) * (self.mean.ndim - 1))
+        return np.sqrt(self.M2 / np.maximum(n - 1, 1))
+
+    def resolution(self):
+        return (self.hi - self.lo) / self.bins
+
+    def percentile(self, q):
+        # Linear interpolation of the histogram CDF inside the bin where it crosses q
+        n = self.count.reshape((-1,) + (1,) * self.mean.ndim)
+        cdf = np.cumsum(self.hist, axis=-1) / np.maximum(n, 1)
+        target = q / 100.0
+        j = np.minimum(np.argmax(cdf >= target, axis=-1), self.bins - 1)
+        above = np.take_along_axis(cdf, j[..., None], axis=-1)[..., 0]
+        below = np.where(j > 0, np.take_along_axis(cdf, np.maximum(j - 1, 0)[..., None], axis=-1)[..., 0], 0.0)
+        frac = np.where(above > below, (target - below) / np.where(above > below, above - below, 1.0), 0.0)
+        value = self.lo + (j + frac) * self.resolution()
+        return np.clip(value, self.min, self.max)
+
+
+class MonteCarloObserver(SolverObserver):
+    # Reduces every step of a batch to per-realization metrics and feeds them to the statistics at the
+    # end of each window of `decimation` steps: pack/cell values at the window end, group imbalances
+    # (max - min over the cells of each parallel group) as the worst value within the window
+    def __init__(self, topology, decimation, stats):
+        self.decimation = decimation
+        self.stats = stats
+        # Cells sorted by group, so each group's extremes are one reduceat
+        self.order = np.argsort(topology['cell_group'], kind='stable')
+        self.group_starts = np.concatenate([[0], np.cumsum(topology['group_size'])[:-1]])
+
+    def group_spread(self, values):
+        values = values[:, self.order]
+        return (np.maximum.reduceat(values, self.group_starts, axis=1)
+                - np.minimum.reduceat(values, self.group_starts, axis=1))
+
+    def on_start(self, run_info):
+        self.steps = 0
+        self.worst = {}
+
+    def on_step(self, step, sim_time):
+        spreads = {'group_SOC_spread': self.group_spread(step['SOC']),
+                   'group_current_spread': self.group_spread(step['I_cells'])}
+        for key, spread in spreads.items():
+            self.worst[key] = spread if key not in self.worst else np.maximum(self.worst[key], spread)
+        self.steps += 1
+        self.last = step
+        if self.steps % self.decimation == 0:
+            self.push()
+
+    def on_finish(self, counters):
+        if self.steps % self.decimation:
+            self.push()
+
+    def push(self):
+        index = (self.steps - 1) // self.decimation
+        step = self.last
+        self.stats['V_module'].update(index, step['V_module'])
+        self.stats['SOC_min'].update(index, np.min(step['SOC'], axis=1))
+        self.stats['SOC_max'].update(index, np.max(step['SOC'], axis=1))
+        self.stats['Vterm_min'].update(index, np.min(step['V_term'], axis=1))
+        self.stats['Vterm_max'].update(index, np.max(step['V_term'], axis=1))
+        for key, worst in self.worst.items():
+            self.stats[key].update(index, worst)
+        self.worst = {}
+
+
+def new_statistics(n_samples, n_groups, bins, ranges=None):
+    shapes = {'V_module': (), 'SOC_min': (), 'SOC_max': (), 'Vterm_min': (), 'Vterm_max': (),
+              'group_SOC_spread': (n_groups,), 'group_current_spread': (n_groups,)}
+    ranges = ranges or {}
+    return {key: StreamingStats(n_samples, shape, bins, *ranges.get(key, (None, None))) for key, shape in shapes.items()}
+
+
+def _monte_carlo_setup(pack, drive, sim, cache_dir=None):
+    # Realizations are only seen through the statistics, so the batch writes nothing but the time base.
+    # Every batch uses the same setup: with a cache_dir the first one builds it and the workers load it.
+    sim = copy.deepcopy(sim)
+    sim['output'] = {'channels': {}}
+    return create_setup_cached(pack, drive, sim, cache_dir)
+
+
+def run_monte_carlo_batch(task):
+    # Runs in a worker process (or in-process for the first batch): one batch of realizations
+    variation = task['variation']
+    setup_data = _monte_carlo_setup(task['pack'], task['drive'], task['sim'], task['cache_dir'])
+    rng = np.random.default_rng(task['seed_sequence'])
+    scenarios = sample_scenarios(variation, setup_data, task['n_realizations'], rng)
+    n_samples = -(-drive_profile_grid(setup_data['drive_profile'])[0] // variation['stats_decimation'])
+    stats = new_statistics(n_samples, setup_data['topology']['n_groups'], variation['sketch_bins'], task['ranges'])
+    observer = MonteCarloObserver(setup_data['topology'], variation['stats_decimation'], stats)
+    with tempfile.TemporaryDirectory() as tmp:
+        run_batched_solver(setup_data, scenarios, h5_path=os.path.join(tmp, 'batch.h5'), observers=[observer])
+    return stats
+
+
+def run_monte_carlo(pack, drive, sim, out_path='monte_carlo_stats.h5', max_workers=None, cache_dir=None):
+    variation = dict(DEFAULT_VARIATION, **pack.get('variation', {}))
+    n_realizations = variation['realizations']
+    batch_size = min(variation['batch_size'], n_realizations)
+    batch_counts = [min(batch_size, n_realizations - start) for start in range(0, n_realizations, batch_size)]
+    # One independent random stream per batch, so results do not depend on the number of workers
+    seed_sequences = np.random.SeedSequence(variation['seed']).spawn(len(batch_counts))
+    tasks = [{'pack': pack, 'drive': drive, 'sim': sim, 'variation': variation, 'n_realizations': count,
+              'seed_sequence': seed_sequence, 'ranges': None, 'cache_dir': cache_dir} for count, seed_sequence in zip(batch_counts, seed_sequences)]
+
+    # The first batch fixes the histogram ranges; the others reuse them so all sketches can be merged
+    stats = run_monte_carlo_batch(tasks[0])
+    ranges = {key: (s.lo, s.hi) for key, s in stats.items()}
+    for task in tasks[1:]:
+        task['ranges'] = ranges
+    done = batch_counts[0]
+    if len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(run_monte_carlo_batch, task): task['n_realizations'] for task in tasks[1:]}
+            for future in as_completed(futures):
+                for key, batch_stats in future.result().items():
+                    stats[key].merge(batch_stats)
+                done += futures[future]
+                print(f"{done}/{n_realizations} realizations")
+
+    setup_data = _monte_carlo_setup(pack, drive, sim, cache_dir)
+    write_statistics(out_path, stats, setup_data, variation)
+    return stats, out_path
+
+
+def write_statistics(out_path, stats, setup_data, variation):
+    grid_steps = drive_profile_grid(setup_data['drive_profile'])[0]
+    decimation = variation['stats_decimation']
+    sample_end = np.minimum(np.arange(decimation, grid_steps + decimation, decimation), grid_steps)
+    with h5py.File(out_path, 'w') as f:
+        f.attrs['realizations'] = variation['realizations']
+        f.attrs['stats_decimation'] = decimation
+        f.attrs['sketch_bins'] = variation['sketch_bins']
+        f.attrs['variation'] = json.dumps(variation['parameters'])
+        f.create_dataset('time', data=drive_profile_times(setup_data['drive_profile'], sample_end))
+        f.create_dataset('parallel_group', data=setup_data['topology']['group_ids'])
+        for key, s in stats.items():
+            group = f.create_group(key)
+            group.create_dataset('count', data=s.count)
+            group.create_dataset('mean', data=s.mean)
+            group.create_dataset('std', data=s.std())
+            group.create_dataset('min', data=s.min)
+            group.create_dataset('max', data=s.max)
+            group.create_dataset('percentile_resolution', data=s.resolution())
+            group.create_dataset('clamped', data=s.clamped)
+            for q in variation['percentiles']:
+                group.create_dataset(f'p{q:g}', data=s.percentile(q))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte-Carlo cell-to-cell variation study with streaming statistics.')
+    parser.add_argument('--pack', default='pack_config.json', help='Pack config with a "variation" section')
+    parser.add_argument('--drive', default='drive_config.json')
+    parser.add_argument('--model', default='model_config.json')
+    parser.add_argument('--out', default='monte_carlo_stats.h5')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Setup cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='Build the setup without the on-disk cache')
+    args = parser.parse_args()
+
+    with open(args.pack, 'r') as f:
+        pack = json.load(f)
+    with open(args.drive, 'r') as f:
+        drive = json.load(f)
+    with open(args.model, 'r') as f:
+        sim = json.load(f)
+
+    stats, out_path = run_monte_carlo(pack, drive, sim, args.out, args.workers,
+                                      None if args.no_cache else args.cache_dir)
+    final = stats['group_SOC_spread']
+    print(f"Worst-group SOC spread at the end: mean {np.max(final.mean[-1]):.4f}, "
+          f"max {np.max(final.max[-1]):.4f} over {final.count[-1]} realizations")
+    print("Statistics written to", out_path)
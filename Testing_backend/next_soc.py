@@ -1,11 +1,15 @@
+import numpy as np
+
 def calculate_next_soc(I_current, dt, capacity, current_SOC, coulombic_efficiency, SOH):
+    # Works on scalars or on arrays of per-cell currents/SOC/SOH
     effective_capacity_As = capacity * SOH * 3600
 
-    if I_current < 0:
-        next_SOC = current_SOC - (I_current * dt / effective_capacity_As) * coulombic_efficiency
-    else:
-        next_SOC = current_SOC - (I_current * dt / effective_capacity_As)
+    charge_step = I_current * dt / effective_capacity_As
+    charge_step = np.where(I_current < 0, charge_step * coulombic_efficiency, charge_step)
+    next_SOC = current_SOC - charge_step
 
-    next_SOC = max(0.0, min(1.0, next_SOC))
+    next_SOC = np.clip(next_SOC, 0.0, 1.0)
 
-    return next_SOC
\ No newline at end of file
+    if np.ndim(next_SOC) == 0:
+        return float(next_SOC)
+    return next_SOC
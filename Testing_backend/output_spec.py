@@ -0,0 +1,88 @@
+import numpy as np
+
+CELL_CHANNELS = [
+    'Vterm', 'SOC', 'OCV', 'Qgen', 'Qirrev', 'Qrev',
+    'V_RC1', 'V_RC2', 'V_R0', 'V_R1', 'V_R2', 'V_C1', 'V_C2',
+    'energy_throughput', 'Qgen_cumulative',
+    'I_cells', 'V_parallel', 'temperature',
+    'SOH', 'DCIR_AgingFactor',
+]
+STEP_CHANNELS = ['dt', 'I_module', 'V_module']
+AGGREGATES = ['min', 'max', 'mean']
+# Bin widths (s) of the min/max/mean pyramid built while the results stream in (1 min, 1 h, 1 day);
+# the 1 min level only for drive cycles stepped faster than that
+DEFAULT_PYRAMID_LEVELS = [60, 3600, 86400]
+
+
+def select_cells(topology, selection):
+    # Every filter given narrows the selection; None (or a missing filter) keeps all cells
+    if not selection:
+        return np.arange(topology['n_cells'])
+    selected = np.ones(topology['n_cells'], dtype=bool)
+    types = selection.get('types')
+    if types:
+        selected &= np.isin(topology['type'], types)
+    groups = selection.get('parallel_groups')
+    if groups:
+        selected &= np.isin(topology['parallel_group'], groups)
+    labels = selection.get('labels')
+    if labels:
+        selected &= np.isin(topology['label'], labels)
+    if not np.any(selected):
+        raise ValueError(f"Output cell selection {selection} matches no cells.")
+    return np.nonzero(selected)[0]
+
+
+def build_output_spec(output_config, topology):
+    # output_config is the 'output' section of model_config.json:
+    # {"cells": {"types": [...], "parallel_groups": [...]},
+    #  "channels": {"SOC": {}, "Qgen": {"decimation": 60, "aggregate": ["min", "max", "mean"]}}}
+    # Without it every channel is recorded for every cell at every step.
+    output_config = output_config or {}
+    default_cells = select_cells(topology, output_config.get('cells'))
+    channels = output_config.get('channels')
+    if channels is None:
+        channels = {key: {} for key in CELL_CHANNELS + STEP_CHANNELS}
+
+    spec = {}
+    for key, channel in channels.items():
+        channel = channel or {}
+        if key not in CELL_CHANNELS and key not in STEP_CHANNELS:
+            raise ValueError(f"Unknown output channel: {key}")
+        decimation = int(channel.get('decimation', 1))
+        if decimation < 1:
+            raise ValueError(f"Decimation for {key} must be >= 1.")
+        aggregate = channel.get('aggregate')
+        if aggregate:
+            for name in aggregate:
+                if name not in AGGREGATES:
+                    raise ValueError(f"Unknown aggregate '{name}' for {key}. Use one of {AGGREGATES}.")
+        if key in CELL_CHANNELS:
+            if 'cells' in channel:
+                cell_index = select_cells(topology, channel['cells'])
+            else:
+                cell_index = default_cells
+        else:
+            cell_index = None
+        spec[key] = {'cells': cell_index, 'decimation': decimation, 'aggregate': aggregate or None}
+
+    # The time base is always kept so every decimated channel can be placed on it
+    spec['dt'] = {'cells': None, 'decimation': 1, 'aggregate': None}
+    return spec
+
+
+def build_pyramid_levels(output_config, typical_dt=0.0):
+    # 'pyramid' in the output section lists the bin widths in seconds; [] turns the pyramid off.
+    # Levels no wider than the typical solver step would hold a bin per step, a copy of the raw
+    # channels three times over, so they are left out.
+    levels = (output_config or {}).get('pyramid', DEFAULT_PYRAMID_LEVELS)
+    levels = sorted(set(float(width) for width in levels or []))
+    if any(width <= 0 for width in levels):
+        raise ValueError(f"Pyramid bin widths must be positive, got {levels}.")
+    # Each level is built from the bins of the next finer one, so its bins must be whole multiples
+    for finer, width in zip(levels, levels[1:]):
+        ratio = width / finer
+        if abs(ratio - round(ratio)) > 1e-9:
+            raise ValueError(f"Pyramid bin width {width:g} is not a multiple of {finer:g}.")
+    return [width for width in levels if width > typical_dt]
+
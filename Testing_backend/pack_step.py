@@ -0,0 +1,182 @@
+# Testing_backend/pack_step.py
+# One solver step of the pack, shared by run_electrical_solver and run_batched_solver. State arrays
+# are (cells,) for a single run or (scenarios, cells) for a batch, with the module current one value
+# per run or scenario; each scenario's voltage limits clamp its own current.
+import numpy as np
+from battery_params import get_battery_params_batch
+from parallel_group_currents import solve_parallel_groups
+from module_voltage import calculate_module_voltage
+from cell_kernels import fused_cell_update
+from current_limit import calculate_limit_current
+from thermal_model import thermal_step
+from aging_model import aging_step, soh_band
+
+
+def build_step_model(setup_data, param_tables, kernel_backend, entropic, thermal=None, aging=None,
+                     record_heat=True, record_energy=True, capacity=None, R0_factor=None):
+    # Everything a step reads but never changes. capacity defaults to the pack value and may be
+    # per cell; R0_factor (per cell, or None) scales R0 for batched manufacturing spread.
+    return {
+        'topology': setup_data['topology'],
+        'param_tables': param_tables,
+        'R_p': setup_data['R_p'],
+        'R_s': setup_data['R_s'],
+        # nan (no limit) never compares as exceeded
+        'voltage_limits': setup_data['voltage_limits'],
+        'capacity': setup_data['capacity'] if capacity is None else capacity,
+        'coulombic_efficiency': setup_data['columbic_efficiency'],
+        'R0_factor': R0_factor,
+        'kernel_backend': kernel_backend,
+        'entropic': entropic,
+        'thermal': thermal,
+        'aging': aging,
+        'record_heat': record_heat,
+        'record_energy': record_energy,
+    }
+
+
+def lookup_params(model, state, charge, SOC=None):
+    # OCV, R0, R1, R2, C1, C2 at the state's SOC (or the SOC given); scenarios charging and
+    # discharging in the same step read different tables
+    args = (state['SOC'] if SOC is None else SOC, state['temperature'] - 273.15)
+    aging_args = (state['SOH'], state['DCIR_AgingFactor'])
+    param_tables = model['param_tables']
+    if np.all(charge):
+        params = get_battery_params_batch(param_tables, *args, 'CHARGE', *aging_args)
+    elif not np.any(charge):
+        params = get_battery_params_batch(param_tables, *args, 'DISCHARGE', *aging_args)
+    else:
+        charging = get_battery_params_batch(param_tables, *args, 'CHARGE', *aging_args)
+        discharging = get_battery_params_batch(param_tables, *args, 'DISCHARGE', *aging_args)
+        params = tuple(np.where(charge[:, None], c, d) for c, d in zip(charging, discharging))
+    if model['R0_factor'] is not None:
+        params = (params[0], params[1] * model['R0_factor']) + params[2:]
+    return params
+
+
+def solve_pack_step(model, state, dt, I_request, counters):
+    # Solves one step from the state without changing it; counters gets the limit solves
+    topology = model['topology']
+    limits = model['voltage_limits']
+    charge = np.asarray(I_request) < 0
+    V_OCV, R0, R1, R2, C1, C2 = lookup_params(model, state, charge)
+    decay1 = np.exp(-dt / (R1 * C1))
+    decay2 = np.exp(-dt / (R2 * C2))
+    K = V_OCV - (state['V_RC1'] * decay1 + state['V_RC2'] * decay2)
+    R_eff = R0 + 2 * model['R_p'] + R1 * (1 - decay1) + R2 * (1 - decay2)
+
+    def respond(I_module):
+        # Only the group solve and what follows from it depend on the module current, so the
+        # limit re-solves reuse the parameters and decays above
+        I_cells, V_parallel = solve_parallel_groups(topology, K, R_eff, I_module)
+        V_RC1 = state['V_RC1'] * decay1 + R1 * I_cells * (1 - decay1)
+        V_RC2 = state['V_RC2'] * decay2 + R2 * I_cells * (1 - decay2)
+        V_term = V_OCV - I_cells * R0 - V_RC1 - V_RC2
+        V_module = calculate_module_voltage(topology, V_parallel, I_module, model['R_s'])
+        return V_term, V_RC1, V_RC2, I_cells, V_parallel, V_module
+
+    V_term, V_RC1, V_RC2, I_cells, V_parallel, V_module = respond(I_request)
+    V_rounded = np.round(V_term, 5)
+    if np.all(charge):
+        V_limit, V_module_limit = limits['cell_upper'], limits['module_upper']
+        cell_limit_hit = np.max(V_rounded, axis=-1) > V_limit
+        module_limit_hit = V_module > V_module_limit
+    elif not np.any(charge):
+        V_limit, V_module_limit = limits['cell_lower'], limits['module_lower']
+        cell_limit_hit = np.min(V_rounded, axis=-1) < V_limit
+        module_limit_hit = V_module < V_module_limit
+    else:
+        V_limit = np.where(charge, limits['cell_upper'], limits['cell_lower'])
+        V_module_limit = np.where(charge, limits['module_upper'], limits['module_lower'])
+        cell_limit_hit = np.where(charge, np.max(V_rounded, axis=-1) > V_limit, np.min(V_rounded, axis=-1) < V_limit)
+        module_limit_hit = np.where(charge, V_module > V_module_limit, V_module < V_module_limit)
+    limited = cell_limit_hit | module_limit_hit
+    I_module = I_request
+    if np.any(limited):
+        # Module voltage is affine in the module current as well, so the same closed form gives
+        # its limit; the smaller of the cell and module limit currents is applied
+        zero = respond(np.zeros_like(I_request))
+        I_limited = np.where(cell_limit_hit, calculate_limit_current(zero[0], V_term, I_request, V_limit, charge),
+                             I_request)
+        I_module_limited = calculate_limit_current(zero[5][..., None], V_module[..., None], I_request,
+                                                   V_module_limit, charge)
+        module_sets = module_limit_hit & (np.abs(I_module_limited) < np.abs(I_limited))
+        counters['module_limited_steps'] += module_sets
+        I_module = np.where(module_sets, I_module_limited, I_limited)
+        # Unlimited scenarios get their requested current again, so their values are unchanged
+        V_term, V_RC1, V_RC2, I_cells, V_parallel, V_module = respond(I_module)
+        counters['limit_solves'] += 2
+    V_term = np.round(V_term, 5)
+
+    # The per-cell kernels are elementwise, so a batch goes through them flattened
+    capacity = model['capacity']
+    results = fused_cell_update(
+        model['kernel_backend'], I_cells.ravel(), dt, np.ravel(capacity) if np.ndim(capacity) else capacity,
+        model['coulombic_efficiency'], state['SOC'].ravel(), state['SOH'].ravel(), state['temperature'].ravel(),
+        V_term.ravel(), R0.ravel(), state['energy_throughput'].ravel(), state['Qgen_cumulative'].ravel(),
+        heat=model['record_heat'], energy=model['record_energy'], entropic=model['entropic']
+    )
+    next_SOC, q_irr, q_rev, q_gen, energy, energy_total, Qgen_total = (
+        None if r is None else r.reshape(I_cells.shape) for r in results
+    )
+    return {
+        'dt': dt, 'charge': charge, 'limited': limited, 'I_module': I_module,
+        'V_term': V_term, 'V_RC1': V_RC1, 'V_RC2': V_RC2, 'I_cells': I_cells, 'V_parallel': V_parallel,
+        'V_module': V_module,
+        'OCV': V_OCV, 'R0': R0, 'R1': R1, 'R2': R2, 'C1': C1, 'C2': C2,
+        'SOC': next_SOC, 'Qirrev': q_irr, 'Qrev': q_rev, 'Qgen': q_gen, 'energy': energy,
+        'energy_total': energy_total, 'Qgen_total': Qgen_total,
+    }
+
+
+def commit_pack_step(model, state, step, writer, counters):
+    # Applies a solved step to the state (thermal and aging included) and records it
+    thermal = model['thermal']
+    aging = model['aging']
+    state['V_term'][:] = step['V_term']
+    state['V_RC1'][:] = step['V_RC1']
+    state['V_RC2'][:] = step['V_RC2']
+    state['SOC'][:] = step['SOC']
+    if thermal is not None:
+        # Heat from this step warms the cells for the next step's parameter lookup
+        state['temperature'][:] = thermal_step(thermal, state['temperature'], step['Qgen'], step['dt'])
+    counters['charge_limited_steps'] += step['limited'] & step['charge']
+    counters['discharge_limited_steps'] += step['limited'] & ~step['charge']
+    counters['solver_steps'] += 1
+
+    writer.record('dt', step['dt'])
+    writer.record('I_cells', step['I_cells'])
+    writer.record('V_parallel', step['V_parallel'])
+    writer.record('I_module', step['I_module'])
+    writer.record('SOC', step['SOC'])
+    writer.record('Vterm', step['V_term'])
+    writer.record('OCV', step['OCV'])
+    writer.record('V_RC1', step['V_RC1'])
+    writer.record('V_RC2', step['V_RC2'])
+    writer.record('V_R0', step['R0'])
+    writer.record('V_R1', step['R1'])
+    writer.record('V_R2', step['R2'])
+    writer.record('V_C1', step['C1'])
+    writer.record('V_C2', step['C2'])
+    if model['record_heat']:
+        state['Qgen_cumulative'][:] = step['Qgen_total']
+        writer.record('Qgen', step['Qgen'])
+        writer.record('Qirrev', step['Qirrev'])
+        writer.record('Qrev', step['Qrev'])
+        writer.record('Qgen_cumulative', state['Qgen_cumulative'])
+    if model['record_energy']:
+        state['energy_throughput'][:] = step['energy_total']
+        writer.record('energy_throughput', state['energy_throughput'])
+    if aging is not None:
+        aged = aging_step(aging, step['dt'], state['temperature'], state['SOH'], state['DCIR_AgingFactor'],
+                          state['energy_throughput'])
+        if aged is not None:
+            # Cells crossing 0.9/0.8 pick up the next SOH parameter table in the following lookup
+            counters['soh_band_switches'] += np.sum(soh_band(aged[0]) != soh_band(state['SOH']), axis=-1)
+            state['SOH'][:], state['DCIR_AgingFactor'][:] = aged
+            counters['aging_updates'] += 1
+    writer.record('SOH', state['SOH'])
+    writer.record('DCIR_AgingFactor', state['DCIR_AgingFactor'])
+    writer.record('V_module', step['V_module'])
+    writer.record('temperature', state['temperature'])
+    writer.advance()
@@ -0,0 +1,142 @@
+import numpy as np
+
+CELL_TYPES = ['corner', 'edge', 'center']
+NEIGHBOR_KINDS = ['row', 'col', 'diagonal']
+
+
+def build_pack_topology(frontend_cells, layers, connection_type):
+    # Structure-of-arrays form of the pack, built once and shared read-only by the solver.
+    # Cells are numbered layer by layer in row-major order; indices are 0-based global cell
+    # indices and next_series is -1 for the last cell of a series chain.
+    layer_index = []
+    row_index = []
+    col_index = []
+    position = []
+    parallel_group = []
+    next_series = []
+    layer_start = []
+    layer_group_ranges = []
+    group_offset = 0
+    n_cells = 0
+    for layer_idx, layer in enumerate(layers):
+        n_rows = layer['n_rows']
+        n_cols = layer['n_cols']
+        rows, cols = np.divmod(np.arange(n_rows * n_cols), n_cols)
+        global_idx = n_cells + rows * n_cols + cols
+        layer_start.append(n_cells)
+
+        layer_index.append(np.full(n_rows * n_cols, layer_idx + 1))
+        row_index.append(rows + 1)
+        col_index.append(cols + 1)
+        position.append(np.column_stack([cols * layer['pitch_x'], rows * layer['pitch_y'],
+                                         np.full(n_rows * n_cols, float(layer['z_center']))]))
+
+        layer_group_start = group_offset + 1
+        # Each row (or column) of a layer is one parallel group, in series with the next one
+        if connection_type == 'row_series_column_parallel':
+            parallel_group.append(layer_group_start + rows)
+            next_series.append(np.where(rows < n_rows - 1, global_idx + n_cols, -1))
+            n_groups = n_rows
+        elif connection_type == 'row_parallel_column_series':
+            parallel_group.append(layer_group_start + cols)
+            next_series.append(np.where(cols < n_cols - 1, global_idx + 1, -1))
+            n_groups = n_cols
+        else:
+            raise ValueError("Unsupported connection type.")
+        layer_group_ranges.append((layer_group_start, layer_group_start + n_groups - 1))
+        group_offset = layer_group_ranges[-1][1]
+        n_cells += n_rows * n_cols
+
+    layer_index = np.concatenate(layer_index)
+    row_index = np.concatenate(row_index)
+    col_index = np.concatenate(col_index)
+    parallel_group = np.concatenate(parallel_group)
+    next_series = np.concatenate(next_series)
+
+    # Connect layers in series: each cell of the previous layer's last group links to the cell
+    # of this layer's first group in the same column (rows for row_parallel_column_series)
+    if connection_type == 'row_series_column_parallel':
+        axis_name, axis_index, axis_size = 'col', col_index, 'n_cols'
+    else:
+        axis_name, axis_index, axis_size = 'row', row_index, 'n_rows'
+    for l in range(1, len(layers)):
+        prev_last_group = layer_group_ranges[l - 1][1]
+        current_first_group = layer_group_ranges[l][0]
+        for k in range(1, layers[l - 1][axis_size] + 1):
+            prev_cells = np.nonzero((parallel_group == prev_last_group) & (axis_index == k))[0]
+            if len(prev_cells) == 0:
+                raise ValueError(f"No cell in prev group {prev_last_group} {axis_name} {k}")
+            curr_cells = np.nonzero((parallel_group == current_first_group) & (axis_index == k))[0]
+            if len(curr_cells) == 0:
+                raise ValueError(f"No cell in curr group {current_first_group} {axis_name} {k}")
+            next_series[prev_cells[0]] = curr_cells[0]
+
+    group_ids, group_first_cell, cell_group = np.unique(parallel_group, return_index=True, return_inverse=True)
+    dim_names = sorted(set().union(*(cell['dims'].keys() for cell in frontend_cells[:n_cells])))
+    topology = {
+        'n_cells': n_cells,
+        'label': np.array([f"R{r}C{c}L{l}" for r, c, l in zip(row_index, col_index, layer_index)]),
+        'position': np.concatenate(position),
+        'dims': {name: np.array([cell['dims'].get(name, np.nan) for cell in frontend_cells[:n_cells]], dtype=float)
+                 for name in dim_names},
+        'layer_index': layer_index,
+        'row_index': row_index,
+        'col_index': col_index,
+        'parallel_group': parallel_group,
+        'next_series': next_series,
+        # 0-based slot of every cell in the sorted group list, used by solve_parallel_groups
+        'group_ids': group_ids,
+        'cell_group': cell_group,
+        'n_groups': len(group_ids),
+        'group_size': np.bincount(cell_group, minlength=len(group_ids)),
+        'group_first_cell': group_first_cell,
+    }
+    topology.update(_classify(layers, layer_start, row_index, col_index, layer_index))
+    # Shared by every step (and every scenario) of a run, so guard against accidental writes
+    for array in list(topology.values()) + list(topology['dims'].values()):
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+    return topology
+
+
+def _classify(layers, layer_start, row_index, col_index, layer_index):
+    # Cell types and CSR neighbour lists: the neighbours of cell i are
+    # neighbor_index[neighbor_ptr[i]:neighbor_ptr[i + 1]], in the order row, col, diagonal
+    # (left/right in the row, up/down in the column, then the four diagonals)
+    n_rows = np.array([layer['n_rows'] for layer in layers])[layer_index - 1]
+    n_cols = np.array([layer['n_cols'] for layer in layers])[layer_index - 1]
+    on_row_edge = (row_index == 1) | (row_index == n_rows)
+    on_col_edge = (col_index == 1) | (col_index == n_cols)
+    cell_type = np.where(on_row_edge & on_col_edge, 0, np.where(on_row_edge | on_col_edge, 1, 2))
+
+    offsets = [
+        (0, -1, 0), (0, 1, 0),
+        (-1, 0, 1), (1, 0, 1),
+        (-1, -1, 2), (-1, 1, 2), (1, -1, 2), (1, 1, 2),
+    ]
+    start = np.array(layer_start)[layer_index - 1]
+    candidates = []
+    kinds = []
+    for dr, dc, kind in offsets:
+        r = row_index + dr
+        c = col_index + dc
+        valid = (r >= 1) & (r <= n_rows) & (c >= 1) & (c <= n_cols)
+        candidates.append(np.where(valid, start + (r - 1) * n_cols + (c - 1), -1))
+        kinds.append(np.full(len(r), kind))
+    candidates = np.column_stack(candidates)
+    kinds = np.column_stack(kinds)
+    valid = candidates >= 0
+    return {
+        'type': np.array(CELL_TYPES)[cell_type],
+        'neighbor_ptr': np.concatenate([[0], np.cumsum(valid.sum(axis=1))]),
+        'neighbor_index': candidates[valid],
+        'neighbor_kind': kinds[valid],
+    }
+
+
+def cell_neighbors(topology, cell_idx, kind=None):
+    start, end = topology['neighbor_ptr'][cell_idx], topology['neighbor_ptr'][cell_idx + 1]
+    neighbors = topology['neighbor_index'][start:end]
+    if kind is None:
+        return neighbors
+    return neighbors[topology['neighbor_kind'][start:end] == NEIGHBOR_KINDS.index(kind)]
@@ -1,43 +1,24 @@
 import numpy as np
 
-def calculate_parallel_group_currents(cells, I_module, R_p, t, I_cells_matrix, V_parallel_matrix, sim_V_term):
-    parallel_groups = sorted(set(cell['parallel_group'] for cell in cells))
-
-    for group_id in parallel_groups:
-        group_cells = [idx for idx, cell in enumerate(cells) if cell['parallel_group'] == group_id]
-        N = len(group_cells)
-        if N == 0:
-            continue
-
-        A = np.zeros((N + 1, N + 1))
-        b = np.zeros(N + 1)
-
-        for i, cell_idx in enumerate(group_cells):
-            cell = cells[cell_idx]
-
-            if t == 0:
-                OCV = cell.get('OCV', 3.7)  # Mock if not set
-                R0 = cell.get('R0', 0.02)
-            else:
-                OCV = sim_V_term[cell_idx]
-                R0 = 0.0
-
-            A[i, i] = R0 + R_p
-            A[i, -1] = 1.0
-            b[i] = OCV
-
-        A[-1, :N] = 1.0
-        b[-1] = I_module[t]
-
-        try:
-            x = np.linalg.solve(A, b)
-        except np.linalg.LinAlgError:
-            print(f"Warning: Singular matrix at time step {t}. Setting currents to zero.")
-            x = np.zeros(N + 1)
-
-        V_parallel_group = x[-1]
-        for i, cell_idx in enumerate(group_cells):
-            I_cells_matrix[cell_idx, t] = x[i]
-            V_parallel_matrix[cell_idx, t] = V_parallel_group
-
-    return I_cells_matrix, V_parallel_matrix
\ No newline at end of file
+def solve_parallel_groups(topology, K, R_eff, I_module):
+    # Each cell obeys K_i - R_eff_i * I_i = V_par and the group currents sum to I_module,
+    # so V_par = (sum(K_i / R_i) - I_module) / sum(1 / R_i) for every group at once.
+    # K and R_eff may be (scenarios, cells) with I_module (scenarios,): every scenario's groups get
+    # their own bins, so the whole batch is still one pass.
+    cell_group = topology['cell_group']
+    n_groups = topology['n_groups']
+    G = 1.0 / R_eff
+    if np.ndim(K) == 2:
+        n_scenarios = K.shape[0]
+        bins = (cell_group + n_groups * np.arange(n_scenarios)[:, None]).ravel()
+        sum_KG = np.bincount(bins, weights=(K * G).ravel(), minlength=n_scenarios * n_groups)
+        sum_G = np.bincount(bins, weights=G.ravel(), minlength=n_scenarios * n_groups)
+        V_par_groups = (sum_KG.reshape(n_scenarios, n_groups) - np.asarray(I_module)[:, None]) / sum_G.reshape(n_scenarios, n_groups)
+        V_parallel = V_par_groups[:, cell_group]
+    else:
+        sum_KG = np.bincount(cell_group, weights=K * G, minlength=n_groups)
+        sum_G = np.bincount(cell_group, weights=G, minlength=n_groups)
+        V_par_groups = (sum_KG - I_module) / sum_G
+        V_parallel = V_par_groups[cell_group]
+    I_cells = (K - V_parallel) * G
+    return I_cells, V_parallel
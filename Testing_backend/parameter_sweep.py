@@ -0,0 +1,153 @@
+# Testing_backend/parameter_sweep.py
+import os
+import csv
+import copy
+import json
+import argparse
+import itertools
+import numpy as np
+import h5py
+from concurrent.futures import ProcessPoolExecutor
+from setup_cache import create_setup_cached, DEFAULT_CACHE_DIR
+from electrical_solver import run_electrical_solver
+
+CELL_FIELDS = ['SOC', 'SOH', 'DCIR_AgingFactor', 'temperature']
+
+
+def expand_parameter_grid(grid):
+    # {"pack.R_p": [0.001, 0.002], "drive.startingSoc": [50, 80]} -> one override dict per combination
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def _set_path(config, path, value):
+    node = config
+    parts = path.split('.')
+    for part in parts[:-1]:
+        node = node[int(part)] if isinstance(node, list) else node[part]
+    if isinstance(node, list):
+        node[int(parts[-1])] = value
+    else:
+        node[parts[-1]] = value
+
+
+def apply_overrides(pack, drive, sim, overrides):
+    # Keys are '<pack|drive|model>.<dotted path>' into the JSON configs, or
+    # 'cell.<global_index>.<SOC|SOH|DCIR_AgingFactor|temperature>' (1-based, as in
+    # init_initial_cell_state's varying_cells) for per-cell values applied after the setup is built
+    configs = {'pack': copy.deepcopy(pack), 'drive': copy.deepcopy(drive), 'model': copy.deepcopy(sim)}
+    cell_overrides = []
+    for key, value in overrides.items():
+        scope, _, path = key.partition('.')
+        if scope == 'cell':
+            cell_idx, field = path.split('.')
+            if field not in CELL_FIELDS:
+                raise ValueError(f"Unsupported cell override field: {field}. Use one of {CELL_FIELDS}.")
+            cell_overrides.append((int(cell_idx), field, value))
+        elif scope in configs:
+            _set_path(configs[scope], path, value)
+        else:
+            raise ValueError(f"Unsupported override key: {key}")
+    return configs['pack'], configs['drive'], configs['model'], cell_overrides
+
+
+def summarize_results(h5_path, block_steps=10000):
+    # Key metrics read back in blocks of steps so memory stays bounded for long runs
+    with h5py.File(h5_path, 'r') as f:
+        steps = int(f.attrs['completed_steps'])
+        summary = {
+            'steps': steps,
+            'clamped_steps': int(f.attrs.get('charge_limited_steps', 0) + f.attrs.get('discharge_limited_steps', 0)),
+            'min_Vterm': np.nan,
+            'final_SOC_mean': np.nan,
+            'final_SOC_min': np.nan,
+            'total_Qgen_J': np.nan,
+        }
+        if steps == 0:
+            return summary
+        vterm_name = 'Vterm_min' if 'Vterm_min' in f else 'Vterm'
+        if vterm_name in f:
+            dset = f[vterm_name]
+            summary['min_Vterm'] = float(min(np.min(dset[:, start:start + block_steps])
+                                             for start in range(0, dset.shape[1], block_steps)))
+        if 'SOC' in f:
+            final_SOC = f['SOC'][:, -1]
+            summary['final_SOC_mean'] = float(np.mean(final_SOC))
+            summary['final_SOC_min'] = float(np.min(final_SOC))
+        if 'Qgen' in f and f['Qgen'].attrs.get('decimation', 1) == 1:
+            # Heat energy over the whole pack: sum of Qgen * dt
+            total = 0.0
+            for start in range(0, steps, block_steps):
+                dt = f['dt'][start:start + block_steps].astype(float)
+                total += float(np.sum(f['Qgen'][:, start:start + block_steps] * dt))
+            summary['total_Qgen_J'] = total
+    return summary
+
+
+def run_sweep_case(case):
+    # Runs in a worker process: build the setup for one parameter combination and solve it headless
+    pack, drive, sim, cell_overrides = apply_overrides(case['pack'], case['drive'], case['sim'], case['overrides'])
+    # Cell overrides are applied after the build, so cases differing only in those share a cache entry
+    setup_data = create_setup_cached(pack, drive, sim, case['cache_dir'])
+    for cell_idx, field, value in cell_overrides:
+        if cell_idx < 1 or cell_idx > setup_data['topology']['n_cells']:
+            raise IndexError(f"Invalid cell index {cell_idx} specified.")
+        setup_data['initial_state'][field][cell_idx - 1] = value
+    run_electrical_solver(setup_data, h5_path=case['h5_path'])
+    summary = summarize_results(case['h5_path'])
+    return dict(case_id=case['case_id'], h5_path=case['h5_path'], **case['overrides'], **summary)
+
+
+def run_parameter_sweep(pack, drive, sim, grid, out_dir='sweep_results', max_workers=None, cache_dir=None):
+    os.makedirs(out_dir, exist_ok=True)
+    cases = []
+    for case_id, overrides in enumerate(expand_parameter_grid(grid)):
+        cases.append({
+            'case_id': case_id,
+            'overrides': overrides,
+            'pack': pack,
+            'drive': drive,
+            'sim': sim,
+            'h5_path': os.path.join(out_dir, f'case_{case_id:04d}.h5'),
+            'cache_dir': cache_dir,
+        })
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        rows = list(pool.map(run_sweep_case, cases))
+
+    summary_path = os.path.join(out_dir, 'sweep_summary.csv')
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else ['case_id'])
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows, summary_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a headless parameter sweep over pack/drive/model configs.')
+    parser.add_argument('grid', help='JSON file mapping override keys (e.g. "pack.R_p", "cell.3.SOH") to lists of values')
+    parser.add_argument('--pack', default='pack_config.json')
+    parser.add_argument('--drive', default='drive_config.json')
+    parser.add_argument('--model', default='model_config.json')
+    parser.add_argument('--out-dir', default='sweep_results')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Setup cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='Build every setup without the on-disk cache')
+    args = parser.parse_args()
+
+    with open(args.pack, 'r') as f:
+        pack = json.load(f)
+    with open(args.drive, 'r') as f:
+        drive = json.load(f)
+    with open(args.model, 'r') as f:
+        sim = json.load(f)
+    with open(args.grid, 'r') as f:
+        grid = json.load(f)
+
+    rows, summary_path = run_parameter_sweep(pack, drive, sim, grid, args.out_dir, args.workers,
+                                            None if args.no_cache else args.cache_dir)
+    columns = ['case_id'] + list(grid.keys()) + ['min_Vterm', 'final_SOC_mean', 'total_Qgen_J', 'clamped_steps']
+    print('  '.join(f'{c:>16}' for c in columns))
+    for row in rows:
+        print('  '.join(f'{row[c]:>16.6g}' if isinstance(row[c], (int, float)) else f'{str(row[c]):>16}' for c in columns))
+    print("Summary written to", summary_path)
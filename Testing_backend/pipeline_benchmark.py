@@ -0,0 +1,273 @@
+# Testing_backend/pipeline_benchmark.py
+# End-to-end benchmark of the simulation pipeline on synthetic packs (layers x rows x cols, both
+# busbar connection types) and synthetic drive cycles of a given length. Each case runs in a fresh
+# process; per-stage times, steps/s and peak memory go to a JSON report that can be compared
+# against one from another commit with --compare.
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+CONNECTION_TYPES = ['row_series_column_parallel', 'row_parallel_column_series']
+STAGES = ['setup', 'drive_flattening', 'parameter_lookup', 'group_solve', 'state_update', 'hdf5_write',
+          'checkpoint', 'solver_other', 'solver_total']
+
+
+def make_synthetic_pack(n_layers, n_rows, n_cols, connection_type, pitch=0.022, layer_pitch=0.075,
+                        capacity=5.0, radius=0.01, height=0.07):
+    # Same layout as the frontend's rectangular cylindrical packs (see pack_config.json)
+    layers = [{'grid_type': 'rectangular', 'n_rows': n_rows, 'n_cols': n_cols, 'pitch_x': pitch, 'pitch_y': pitch,
+               'z_center': layer * layer_pitch, 'z_mode': 'explicit'} for layer in range(n_layers)]
+    cells = []
+    for layer in range(n_layers):
+        for r in range(n_rows):
+            for c in range(n_cols):
+                x, y = c * pitch, r * pitch
+                cells.append({
+                    'global_index': len(cells) + 1,
+                    'layer_index': layer + 1,
+                    'row_index': r + 1,
+                    'col_index': c + 1,
+                    'position': [x, y, layers[layer]['z_center']],
+                    'dims': {'height': height, 'radius': radius},
+                    'bbox_2d': {'xmin': x - radius, 'xmax': x + radius, 'ymin': y - radius, 'ymax': y + radius},
+                    'label': f"R{r + 1}C{c + 1}L{layer + 1}",
+                })
+    return {
+        'cells': cells,
+        'meta': {'layers': layers, 'formFactor': 'cylindrical'},
+        'capacity': capacity,
+        'columbic_efficiency': 1,
+        'connection_type': connection_type,
+        'R_p': 0.001,
+        'R_s': 0.001,
+        # No module limits: the series count varies with the pack size
+        'voltage_limits': {'cell_upper': 4.2, 'cell_lower': None, 'module_upper': None, 'module_lower': None},
+        'masses': {'cell': 0.06725, 'jellyroll': 0.05708},
+    }
+
+
+def cells_per_group(n_rows, n_cols, connection_type):
+    return n_cols if connection_type == 'row_series_column_parallel' else n_rows
+
+
+def make_synthetic_drive(num_days, module_capacity, drive_hours=2.0, c_rate=0.2, start_date='2025-01-01'):
+    # One drive cycle every day: a dynamic (60 s steps) discharge and an equal dynamic charge, so the
+    # solver takes about 2 * drive_hours * 60 steps per day plus the idle rest of the day
+    duration = int(drive_hours * 3600)
+    current = c_rate * module_capacity
+    return {
+        'subCycles': [
+            {'id': 'SC-D', 'name': 'Discharge', 'steps': [
+                {'value': current, 'isDynamic': True, 'unit': 'A', 'duration': duration, 'repetitions': 1}]},
+            {'id': 'SC-C', 'name': 'Charge', 'steps': [
+                {'value': -current, 'isDynamic': True, 'unit': 'A', 'duration': duration, 'repetitions': 1}]},
+        ],
+        'driveCycles': [{'id': 'DC-BENCH', 'name': 'Benchmark day', 'segments': [
+            {'subCycleId': 'SC-D', 'repetitions': 1, 'ambientTemp': 25},
+            {'subCycleId': 'SC-C', 'repetitions': 1, 'ambientTemp': 25}]}],
+        'calendarRules': [],
+        'defaultDriveCycleId': 'DC-BENCH',
+        'startDate': start_date,
+        'numDays': num_days,
+        'startingSoc': 80,
+    }
+
+
+def _instrument(timers):
+    # Wraps the stage functions where the pipeline looks them up (module globals / class attributes),
+    # accumulating wall time per stage; only done inside the benchmark's worker processes
+    import data_processor
+    import electrical_solver
+    import pack_step
+    from results_writer import StreamingResultsWriter
+
+    def wrap(owner, name, stage):
+        fn = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timers[stage] += time.perf_counter() - start
+        setattr(owner, name, timed)
+
+    def wrap_iter(owner, name, stage):
+        # A generator does its work in each next(), so those calls are what is timed
+        fn = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            items = fn(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    timers[stage] += time.perf_counter() - start
+                yield item
+        setattr(owner, name, timed)
+
+    # Drive flattening is building the run-length profile in setup plus expanding its chunks in the solver
+    wrap(data_processor, 'build_drive_profile', 'drive_flattening')
+    wrap_iter(electrical_solver, 'iter_drive_profile', 'drive_flattening')
+    wrap(pack_step, 'get_battery_params_batch', 'parameter_lookup')
+    wrap(pack_step, 'solve_parallel_groups', 'group_solve')
+    wrap(pack_step, 'fused_cell_update', 'state_update')
+    wrap(electrical_solver, 'write_checkpoint', 'checkpoint')
+    wrap(StreamingResultsWriter, 'record', 'hdf5_write')
+    wrap(StreamingResultsWriter, 'flush', 'hdf5_write')
+
+
+def run_benchmark_case(case):
+    from data_processor import create_setup
+    from electrical_solver import run_electrical_solver
+    from solver_observers import SolverObserver
+
+    class CounterObserver(SolverObserver):
+        def on_finish(self, counters):
+            self.counters = dict(counters)
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timers = dict.fromkeys(STAGES, 0.0)
+    _instrument(timers)
+
+    n_layers, n_rows, n_cols = case['size']
+    pack = make_synthetic_pack(n_layers, n_rows, n_cols, case['connection_type'])
+    module_capacity = pack['capacity'] * cells_per_group(n_rows, n_cols, case['connection_type'])
+    drive = make_synthetic_drive(case['days'], module_capacity, case['drive_hours'])
+
+    start = time.perf_counter()
+    setup_data = create_setup(pack, drive, case['sim'])
+    timers['setup'] = time.perf_counter() - start - timers['drive_flattening']
+
+    observer = CounterObserver()
+    setup_flattening = timers['drive_flattening']
+    with tempfile.TemporaryDirectory() as tmp:
+        h5_path = os.path.join(tmp, 'benchmark.h5')
+        start = time.perf_counter()
+        run_electrical_solver(setup_data, h5_path=h5_path, observers=[observer])
+        timers['solver_total'] = time.perf_counter() - start
+        results_bytes = os.path.getsize(h5_path)
+    timers['solver_other'] = timers['solver_total'] - (timers['drive_flattening'] - setup_flattening) - sum(
+        timers[stage] for stage in ['parameter_lookup', 'group_solve', 'state_update', 'hdf5_write', 'checkpoint'])
+
+    steps = observer.counters['solver_steps']
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'connection_type': case['connection_type'],
+        'layers': n_layers, 'rows': n_rows, 'cols': n_cols,
+        'n_cells': int(setup_data['topology']['n_cells']),
+        'n_groups': int(setup_data['topology']['n_groups']),
+        'days': case['days'],
+        'steps': steps,
+        'steps_per_s': steps / timers['solver_total'] if timers['solver_total'] > 0 else None,
+        'stages_s': timers,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 2**20,
+        'baseline_rss_mb': baseline_rss * rss_unit / 2**20,
+        'results_mb': results_bytes / 2**20,
+    }
+
+
+def case_key(result):
+    return f"{result['connection_type']}/{result['layers']}x{result['rows']}x{result['cols']}/{result['days']}d"
+
+
+def run_benchmark(sizes, connection_types, days_list, sim, drive_hours=2.0, repeats=1):
+    # Each case (and repeat) gets a fresh process so peak memory is per case; the fastest repeat is kept
+    results = []
+    for size in sizes:
+        for connection_type in connection_types:
+            for days in days_list:
+                case = {'size': size, 'connection_type': connection_type, 'days': days,
+                        'drive_hours': drive_hours, 'sim': sim}
+                runs = []
+                for _ in range(repeats):
+                    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                        runs.append(pool.submit(run_benchmark_case, case).result())
+                best = min(runs, key=lambda r: r['stages_s']['solver_total'])
+                results.append(best)
+                print(f"{case_key(best):>44}  {best['n_cells']:>7} cells  {best['steps']:>8} steps  "
+                      f"{best['steps_per_s']:>10.1f} steps/s  {best['peak_rss_mb']:>8.1f} MB")
+    return results
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def compare_reports(report, baseline):
+    # Ratios new/baseline per matching case: steps/s (>1 is faster) and stage times (<1 is faster)
+    old = {case_key(r): r for r in baseline['cases']}
+    print(f"\nCompared with {baseline['environment'].get('commit')} (steps/s ratio, then stage time ratios):")
+    print(f"{'case':>44}  {'steps/s':>8}" + ''.join(f"  {stage[:12]:>12}" for stage in STAGES))
+    for result in report['cases']:
+        base = old.get(case_key(result))
+        # Reports written before every synthetic layout could be built carry failed cases
+        if base is None or 'error' in base:
+            continue
+        ratios = [result['steps_per_s'] / base['steps_per_s']]
+        ratios += [result['stages_s'][s] / base['stages_s'][s] if base['stages_s'][s] > 0 else float('nan') for s in STAGES]
+        print(f"{case_key(result):>44}  {ratios[0]:>8.2f}" + ''.join(f"  {r:>12.2f}" for r in ratios[1:]))
+
+
+def parse_size(text):
+    parts = text.lower().split('x')
+    if len(parts) != 3:
+        raise argparse.ArgumentTypeError(f"Pack size must be LAYERSxROWSxCOLS, got {text}")
+    return tuple(int(p) for p in parts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulation pipeline on synthetic packs and drive cycles.')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(2, 3, 3), (4, 8, 8), (8, 16, 16)],
+                        help='Pack sizes as LAYERSxROWSxCOLS')
+    parser.add_argument('--connections', nargs='+', choices=CONNECTION_TYPES, default=CONNECTION_TYPES)
+    parser.add_argument('--days', type=int, nargs='+', default=[30], help='Drive profile lengths in days')
+    parser.add_argument('--drive-hours', type=float, default=2.0,
+                        help='Hours of dynamic discharge (and of charge) per day; sets the steps per day')
+    parser.add_argument('--model', default='model_config.json', help='Model config (output spec, thermal, life, backend)')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--out', default='benchmark_report.json')
+    parser.add_argument('--compare', default=None, help='Earlier report to compare against')
+    args = parser.parse_args()
+
+    with open(args.model, 'r') as f:
+        sim = json.load(f)
+
+    cases = run_benchmark(args.sizes, args.connections, args.days, sim, args.drive_hours, args.repeats)
+    report = {
+        'environment': environment_info(),
+        'settings': {'model': args.model, 'drive_hours': args.drive_hours, 'repeats': args.repeats,
+                     'kernel_backend': sim['electrical'].get('kernel_backend')},
+        'cases': cases,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Report written to", args.out)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare_reports(report, json.load(f))
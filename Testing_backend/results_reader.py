@@ -0,0 +1,360 @@
+# Testing_backend/results_reader.py
+# Lazy access to a results file written by StreamingResultsWriter. A series is selected by cell
+# label/index or parallel group and by a simulated-time window, and only that slice is read from the
+# compressed datasets, or memory-mapped from a file made by export_uncompressed. overview() serves
+# plots from the min/max/mean pyramid, so they draw about the same number of points for any run length.
+import os
+import json
+import time
+import argparse
+import h5py
+import numpy as np
+from results_writer import level_name
+
+
+class SeriesView:
+    # One channel for the selected cells over a range of stored samples; nothing is read until
+    # read() (or np.asarray). Per-cell channels give (cells, samples), or (samples,) for one cell.
+    def __init__(self, reader, name, rows, start, stop, scenario, single):
+        self.reader = reader
+        self.name = name
+        self.rows = rows
+        self.start = start
+        self.stop = stop
+        self.scenario = scenario
+        self.single = single
+
+    @property
+    def time(self):
+        # Simulated time (s) at the end of each selected sample
+        return self.reader.sample_time(self.name, self.scenario)[self.start:self.stop]
+
+    @property
+    def shape(self):
+        n = self.stop - self.start
+        return (n,) if self.rows is None or self.single else (len(self.rows), n)
+
+    def read(self):
+        data = self.reader._dataset(self.name)
+        lead = () if self.scenario is None else (self.scenario,)
+        window = slice(self.start, self.stop)
+        if self.rows is None:
+            return np.asarray(data[lead + (window,)])
+        rows = self.rows
+        if isinstance(data, np.ndarray):
+            values = data[lead + (rows, window)]
+        elif len(rows) and np.all(np.diff(rows) == 1):
+            values = data[lead + (slice(rows[0], rows[-1] + 1), window)]
+        else:
+            # h5py wants increasing, unique row lists
+            unique, inverse = np.unique(rows, return_inverse=True)
+            values = data[lead + (list(unique), window)][inverse]
+        return values[0] if self.single else values
+
+    def blocks(self, block_samples=100000):
+        # The selection in pieces of at most block_samples samples, for reductions over long runs
+        for start in range(self.start, self.stop, block_samples):
+            yield SeriesView(self.reader, self.name, self.rows, start, min(start + block_samples, self.stop),
+                             self.scenario, self.single)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.read()
+        return values if dtype is None else values.astype(dtype)
+
+
+class ResultsReader:
+    def __init__(self, h5_path):
+        self.h5_path = h5_path
+        self.file = h5py.File(h5_path, 'r')
+        self.completed_steps = int(self.file.attrs['completed_steps'])
+        self.n_scenarios = len(self.file['scenarios/name']) if 'scenarios' in self.file else None
+        # Files written without a topology have no labels; cells are then selected by index only
+        cells = self.file.get('cells')
+        self.labels = cells['label'].asstr()[()] if cells is not None else None
+        self.cell_types = cells['type'].asstr()[()] if cells is not None else None
+        self.parallel_group = cells['parallel_group'][()] if cells is not None else None
+        self._label_index = {label: i for i, label in enumerate(self.labels)} if cells is not None else None
+        self._mapped = {}
+        self._time = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mapped = {}
+        self.file.close()
+
+    def channels(self):
+        return [name for name, item in self.file.items() if isinstance(item, h5py.Dataset)]
+
+    def _dataset(self, name):
+        # Contiguous, uncompressed datasets (export_uncompressed) are memory-mapped
+        if name not in self._mapped:
+            dset = self.file[name]
+            offset = dset.id.get_offset() if dset.chunks is None and dset.compression is None else None
+            if offset is not None and dset.size:
+                self._mapped[name] = np.memmap(self.h5_path, dtype=dset.dtype, mode='r', offset=offset,
+                                               shape=dset.shape)
+            else:
+                self._mapped[name] = dset
+        return self._mapped[name]
+
+    def cell_index(self, cells=None, parallel_groups=None):
+        # Global (0-based) cell indices from labels ('R1C1L1'), indices and/or parallel group ids
+        if cells is None and parallel_groups is None:
+            raise ValueError("Select cells by label/index or by parallel group.")
+        selected = []
+        for cell in ([] if cells is None else [cells] if isinstance(cells, (str, int, np.integer)) else cells):
+            if isinstance(cell, str):
+                if self._label_index is None:
+                    raise ValueError(f"{self.h5_path} has no cell labels; select cells by index.")
+                if cell not in self._label_index:
+                    raise KeyError(f"No cell labelled {cell} in {self.h5_path}.")
+                selected.append(self._label_index[cell])
+            else:
+                selected.append(int(cell))
+        if parallel_groups is not None:
+            if self.parallel_group is None:
+                raise ValueError(f"{self.h5_path} has no parallel groups; select cells by index.")
+            groups = [parallel_groups] if np.isscalar(parallel_groups) else parallel_groups
+            selected.extend(np.nonzero(np.isin(self.parallel_group, groups))[0])
+        return np.array(selected, dtype=int)
+
+    def recorded_cells(self, name):
+        return self.file[name].attrs['cell_index']
+
+    def label(self, cell):
+        return self.labels[cell] if self.labels is not None else f'cell {cell}'
+
+    def n_samples(self, name):
+        decimation = self.file[name].attrs.get('decimation', 1)
+        return min(self.file[name].shape[-1], -(-self.completed_steps // decimation))
+
+    def sample_time(self, name, scenario=None):
+        # Simulated time (s) at the end of each stored sample of `name` (cumulative dt, in float64)
+        key = (self.file[name].attrs.get('decimation', 1), scenario)
+        if key not in self._time:
+            dt = self._dataset('dt')
+            dt = dt[:self.completed_steps] if scenario is None else dt[scenario, :self.completed_steps]
+            time_cum = np.cumsum(np.asarray(dt, dtype=float))
+            n = len(time_cum)
+            decimation = key[0]
+            self._time[key] = time_cum[np.minimum(np.arange(decimation, n + decimation, decimation), n) - 1]
+        return self._time[key]
+
+    def select(self, name, cells=None, parallel_groups=None, t_start=None, t_end=None, scenario=None):
+        if name not in self.file:
+            raise KeyError(f"Channel {name} is not in {self.h5_path}.")
+        if self.n_scenarios is not None and scenario is None:
+            raise ValueError(f"{self.h5_path} holds {self.n_scenarios} scenarios; pass scenario=.")
+        rows = None
+        single = False
+        if 'cell_index' in self.file[name].attrs:
+            if cells is None and parallel_groups is None:
+                rows = np.arange(len(self.recorded_cells(name)))
+            else:
+                index = self.cell_index(cells, parallel_groups)
+                recorded = self.recorded_cells(name)
+                position = {cell: row for row, cell in enumerate(recorded)}
+                missing = [self.label(cell) for cell in index if cell not in position]
+                if missing:
+                    raise KeyError(f"{name} is not recorded for {', '.join(missing)}.")
+                rows = np.array([position[cell] for cell in index], dtype=int)
+                single = parallel_groups is None and isinstance(cells, (str, int, np.integer))
+        start, stop = 0, self.n_samples(name)
+        if t_start is not None or t_end is not None:
+            sample_time = self.sample_time(name, scenario)[:stop]
+            if t_start is not None:
+                start = int(np.searchsorted(sample_time, t_start, side='left'))
+            if t_end is not None:
+                stop = int(np.searchsorted(sample_time, t_end, side='right'))
+        return SeriesView(self, name, rows, start, max(start, stop), scenario, single)
+
+    def series(self, name, cells=None, parallel_groups=None, t_start=None, t_end=None, scenario=None):
+        return self.select(name, cells, parallel_groups, t_start, t_end, scenario).read()
+
+    def pyramid_levels(self, name=None):
+        # Bin widths (s) of the min/max/mean pyramid, finest first (of those that hold `name`)
+        if 'pyramid' not in self.file:
+            return []
+        return sorted(group.attrs['bin_width'] for group in self.file['pyramid'].values()
+                      if name is None or f'{name}_mean' in group)
+
+    def _level_bins(self, width):
+        key = ('pyramid', width)
+        if key not in self._time:
+            group = self.file[f'pyramid/{level_name(width)}']
+            self._time[key] = (group['time'][()], group['duration'][()])
+        return self._time[key]
+
+    def choose_level(self, name, t_start=None, t_end=None, points=2000, scenario=None):
+        # 'raw' if the window holds at most `points` samples, else the finest pyramid level with at
+        # most `points` bins in it (the coarsest if none is that coarse)
+        if self.select(name, t_start=t_start, t_end=t_end, scenario=scenario).shape[-1] <= points:
+            return 'raw'
+        levels = self.pyramid_levels(name)
+        for width in levels:
+            bin_time = self._level_bins(width)[0]
+            start = 0 if t_start is None else np.searchsorted(bin_time, t_start, side='left')
+            stop = len(bin_time) if t_end is None else np.searchsorted(bin_time, t_end, side='right')
+            if stop - start <= points:
+                return width
+        return levels[-1] if levels else 'raw'
+
+    def overview(self, name, cells=None, parallel_groups=None, t_start=None, t_end=None, points=2000,
+                 level=None, scenario=None):
+        # At most `points` min/max/mean samples of a channel over a time window, for plotting, from the
+        # level choose_level picks (or `level`: 'raw' or a bin width). Sources with more samples than
+        # that (the coarsest level of a long run, raw data without a pyramid) are merged further.
+        # Returns time (s, end of each sample or bin), min, max, mean and the level used.
+        view = self.select(name, cells, parallel_groups, t_start, t_end, scenario)
+        if level is None:
+            level = self.choose_level(name, t_start, t_end, points, scenario)
+        if level == 'raw':
+            sample_time = view.time
+            low = high = mean = view.read()
+            weight = np.ones(len(sample_time))
+        else:
+            bin_time, duration = self._level_bins(level)
+            start = 0 if t_start is None else int(np.searchsorted(bin_time, t_start, side='left'))
+            stop = len(bin_time) if t_end is None else int(np.searchsorted(bin_time, t_end, side='right'))
+            prefix = f'pyramid/{level_name(level)}/{name}'
+            low, high, mean = (SeriesView(self, f'{prefix}_{part}', view.rows, start, max(start, stop), None,
+                                          view.single).read() for part in ['min', 'max', 'mean'])
+            sample_time = bin_time[start:stop]
+            weight = duration[start:stop]
+        n = len(sample_time)
+        if n > points:
+            size = -(-n // points)
+            starts = np.arange(0, n, size)
+            low = np.minimum.reduceat(low, starts, axis=-1)
+            high = np.maximum.reduceat(high, starts, axis=-1)
+            mean = np.add.reduceat(mean * weight, starts, axis=-1) / np.add.reduceat(weight, starts)
+            sample_time = sample_time[np.minimum(starts + size, n) - 1]
+        return {'time': sample_time, 'min': low, 'max': high, 'mean': mean, 'level': level}
+
+
+def export_uncompressed(h5_path, out_path, block_samples=100000):
+    # Copy of a results file with every channel contiguous and uncompressed (cut to the completed
+    # steps), so ResultsReader memory-maps it for random access. Groups are copied as they are.
+    with h5py.File(h5_path, 'r') as src, h5py.File(out_path, 'w') as dst:
+        completed_steps = int(src.attrs['completed_steps'])
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+        for name, item in src.items():
+            if not isinstance(item, h5py.Dataset):
+                src.copy(item, dst, name)
+                continue
+            n = min(item.shape[-1], -(-completed_steps // item.attrs.get('decimation', 1)))
+            out = dst.create_dataset(name, shape=item.shape[:-1] + (n,), dtype=item.dtype)
+            for start in range(0, n, block_samples):
+                out[..., start:start + block_samples] = item[..., start:min(start + block_samples, n)]
+            for key, value in item.attrs.items():
+                out.attrs[key] = value
+    return out_path
+
+
+def dashboard_payload(reader, cell=None, max_points=2000, scenario=None):
+    # Results in the shape the frontend's results dashboard renders ({summary, timeSeries, metadata}),
+    # at most max_points rows, for one cell (the first recorded one by default) and the module
+    def recorded(name):
+        return name in reader.file
+
+    if cell is None:
+        for name in ['SOC', 'Vterm', 'temperature']:
+            if recorded(name):
+                cell = int(reader.recorded_cells(name)[0])
+                break
+    # Rows follow the module current's overview (the time base if it is not recorded); every
+    # channel is read from the same pyramid level and placed on those rows
+    base = 'I_module' if recorded('I_module') else 'dt'
+    base_view = reader.overview(base, points=max_points, scenario=scenario)
+    level, times = base_view['level'], base_view['time']
+
+    def at(name, cells):
+        # Mean of the channel over the sample/bin ending at (or after) each row time
+        view = reader.overview(name, cells, points=max_points, level=level, scenario=scenario)
+        idx = np.minimum(np.searchsorted(view['time'], times), len(view['time']) - 1)
+        return view['mean'][idx].astype(float)
+
+    columns = {'time': times}
+    columns['soc'] = at('SOC', cell) * 100 if recorded('SOC') else None
+    columns['voltage'] = at('V_module', None) if recorded('V_module') else None
+    columns['current'] = at('I_module', None) if recorded('I_module') else None
+    columns['temperature'] = at('temperature', cell) - 273.15 if recorded('temperature') else None
+    if columns['voltage'] is not None and columns['current'] is not None:
+        columns['power'] = columns['voltage'] * columns['current'] / 1000
+    else:
+        columns['power'] = None
+
+    summary = {'finalSoc': None, 'totalEnergy': None, 'maxTemperature': None, 'efficiency': None,
+               'stateOfHealth': None}
+    if recorded('SOC'):
+        summary['finalSoc'] = round(float(reader.series('SOC', cell, scenario=scenario)[-1]) * 100, 1)
+    if all(recorded(name) and reader.file[name].attrs.get('decimation', 1) == 1 for name in ['V_module', 'I_module']):
+        # Energy moved through the module terminals, kWh
+        energy = 0.0
+        for V, I, dt in zip(*(reader.select(name, scenario=scenario).blocks() for name in ['V_module', 'I_module', 'dt'])):
+            energy += float(np.sum(np.abs(V.read().astype(float) * I.read()) * dt.read()))
+        summary['totalEnergy'] = round(energy / 3.6e6, 2)
+    if recorded('temperature'):
+        summary['maxTemperature'] = round(float(np.max(reader.series('temperature', cell, scenario=scenario))) - 273.15, 1)
+    if recorded('SOH'):
+        summary['stateOfHealth'] = round(float(reader.series('SOH', cell, scenario=scenario)[-1]) * 100, 1)
+
+    time_series = [{key: (None if values is None else float(values[i])) for key, values in columns.items()}
+                   for i in range(len(times))]
+    return {
+        'summary': summary,
+        'timeSeries': time_series,
+        'metadata': {
+            'resultsFile': os.path.abspath(reader.h5_path),
+            'cell': None if cell is None else reader.label(cell),
+            'completedSteps': reader.completed_steps,
+            'level': level,
+            'simulationTime': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(os.path.getmtime(reader.h5_path))),
+        },
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect, slice or export a simulation results file.')
+    parser.add_argument('h5_path', nargs='?', default='simulation_results.h5')
+    parser.add_argument('--channel', help='Print one channel for --cells/--groups over --t-start/--t-end (days)')
+    parser.add_argument('--cells', nargs='+', default=None, help='Cell labels (e.g. R1C1L1) or indices')
+    parser.add_argument('--groups', type=int, nargs='+', default=None, help='Parallel group ids')
+    parser.add_argument('--t-start', type=float, default=None)
+    parser.add_argument('--t-end', type=float, default=None)
+    parser.add_argument('--scenario', type=int, default=None)
+    parser.add_argument('--export', default=None, help='Write an uncompressed, memory-mappable copy here')
+    parser.add_argument('--dashboard', default=None, help='Write the dashboard JSON (summary/timeSeries) here')
+    args = parser.parse_args()
+
+    if args.export:
+        print("Uncompressed copy written to", export_uncompressed(args.h5_path, args.export))
+    with ResultsReader(args.h5_path) as reader:
+        if args.dashboard:
+            cell = None
+            if args.cells:
+                cell = reader.cell_index(int(args.cells[0]) if args.cells[0].isdigit() else args.cells[0])[0]
+            with open(args.dashboard, 'w') as f:
+                json.dump(dashboard_payload(reader, cell, scenario=args.scenario), f)
+            print("Dashboard data written to", args.dashboard)
+        if args.channel:
+            cells = None if args.cells is None else [int(c) if c.isdigit() else c for c in args.cells]
+            view = reader.select(args.channel, cells, args.groups,
+                                 None if args.t_start is None else args.t_start * 86400,
+                                 None if args.t_end is None else args.t_end * 86400, args.scenario)
+            values = view.read()
+            print(f"{args.channel}: {values.shape} samples from day {view.time[0] / 86400:.3f} to "
+                  f"{view.time[-1] / 86400:.3f}" if view.shape[-1] else f"{args.channel}: no samples in the window")
+            print(values)
+        if not args.channel and not args.dashboard and not args.export:
+            print(f"{args.h5_path}: {reader.completed_steps} steps"
+                  + (f", {reader.n_scenarios} scenarios" if reader.n_scenarios is not None else ''))
+            for name in reader.channels():
+                dset = reader.file[name]
+                print(f"  {name:<24} {str(dset.shape):<16} decimation {dset.attrs.get('decimation', 1)}")
@@ -0,0 +1,417 @@
+import numpy as np
+import h5py
+from output_spec import AGGREGATES
+
+# Per-cell datasets are chunked a few cells high rather than all recorded cells high, so reading one
+# cell's series (see results_reader.py) decompresses little of the other cells' data
+CELL_CHUNK_BYTES = 2**16
+# A flush completes only a few bins per level, and the chunk they land in is compressed again each time
+PYRAMID_CHUNK_BINS = 128
+
+
+def level_name(width):
+    return f'{width:g}'
+
+
+def pyramid_bins(t_end, width):
+    # Bin k of a level covers simulated time (k * width, (k + 1) * width]; a step goes to the bin its
+    # end time falls in, so a step ending exactly on a boundary closes the earlier bin
+    return np.maximum(np.ceil(t_end / width).astype(np.int64) - 1, 0)
+
+
+# What an open decimation window keeps per output: the last step, or running min/max/sum
+WINDOW_PARTS = {None: 'last', 'min': 'min', 'max': 'max', 'mean': 'sum'}
+
+
+def reduce_samples(data, decimation, aggregate, window=None):
+    # Collapse buffered steps into windows of `decimation` steps: one sample per window, the last step
+    # of the window or one value per requested aggregate. `window` is the window left open by the
+    # previous buffer ({'steps': steps in it, part: values}); the buffer continues it. Returns the
+    # samples of the windows completed here and the window still open (None on a window boundary).
+    n = data.shape[-1]
+    if n == 0:
+        return {name: data for name in (aggregate or [None])}, window
+    if decimation == 1:
+        return {name: data for name in (aggregate or [None])}, None
+    done = 0 if window is None else window['steps']
+    if done:
+        # The first window finishes the open one
+        starts = np.concatenate([[0], np.arange(decimation - done, n, decimation)])
+    else:
+        starts = np.arange(0, n, decimation)
+    ends = np.append(starts[1:], n)
+    counts = ends - starts
+    counts[0] += done
+    parts = {}
+    for name in (aggregate or [None]):
+        part = WINDOW_PARTS[name]
+        if part == 'last':
+            parts[part] = data[..., ends - 1]
+        elif part == 'min':
+            parts[part] = np.minimum.reduceat(data, starts, axis=-1)
+        elif part == 'max':
+            parts[part] = np.maximum.reduceat(data, starts, axis=-1)
+        else:
+            parts[part] = np.add.reduceat(data, starts, axis=-1, dtype=float)
+        if done and part != 'last':
+            merge = {'min': np.minimum, 'max': np.maximum, 'sum': np.add}[part]
+            parts[part][..., :1] = merge(parts[part][..., :1], window[part])
+    n_complete = len(counts) if counts[-1] == decimation else len(counts) - 1
+    out = {}
+    for name in (aggregate or [None]):
+        part = WINDOW_PARTS[name]
+        values = parts[part][..., :n_complete]
+        out[name] = values / decimation if part == 'sum' else values
+    if n_complete == len(counts):
+        return out, None
+    window = {'steps': int(counts[-1])}
+    for part, values in parts.items():
+        window[part] = values[..., -1:].copy()
+    return out, window
+
+
+def window_samples(window, aggregate):
+    # The sample an open window gives if the run ends inside it
+    out = {}
+    for name in (aggregate or [None]):
+        part = WINDOW_PARTS[name]
+        out[name] = window[part] / window['steps'] if part == 'sum' else window[part]
+    return out
+
+
+def dataset_name(key, aggregate_name):
+    return key if aggregate_name is None else f'{key}_{aggregate_name}'
+
+
+class StreamingResultsWriter:
+    # Keeps only the last `buffer_steps` steps in memory. The solver passes each step's values to
+    # record() and calls advance(); full buffers are reduced per the output spec and appended to
+    # resizable, time-chunked datasets of a file that stays open for the whole run.
+    # With resume_steps the existing file is reopened instead, its datasets are cut back to the
+    # samples of the first resume_steps steps and new steps are appended after them.
+    # With n_scenarios every buffer and dataset gets a leading scenario axis (see batch_solver.py)
+    # and record() takes values with that axis first. With a topology the cell labels, parallel
+    # groups and types are stored in a 'cells' group so results can be selected by label.
+    # With pyramid_levels (bin widths in s, each a multiple of the next finer one) every channel also
+    # gets min/max/mean per time bin under pyramid/<width>/: the finest level is built from every step
+    # as it streams in, each coarser one from the bins of the level below it.
+    # Decimation windows and pyramid bins may straddle a flush: the open one is kept reduced (one value
+    # per cell) until later steps complete it. checkpoint_state() returns them for the checkpoint and
+    # they come back through resume_state= on resume.
+    def __init__(self, h5_path, spec, buffer_steps=1000, resume_steps=None, n_scenarios=None, topology=None,
+                 pyramid_levels=None, resume_state=None):
+        self.h5_path = h5_path
+        self.spec = spec
+        self.buffer_steps = buffer_steps
+        self.buffer = {}
+        lead = () if n_scenarios is None else (n_scenarios,)
+        for key, channel in spec.items():
+            if channel['cells'] is None:
+                self.buffer[key] = np.zeros(lead + (self.buffer_steps,), dtype='float32')
+            else:
+                self.buffer[key] = np.zeros(lead + (len(channel['cells']), self.buffer_steps), dtype='float32')
+        self.slot = 0
+        self.steps_written = 0
+        # Open decimation window per channel (None: the written steps end on a window boundary)
+        self.windows = dict.fromkeys(spec)
+        if pyramid_levels and n_scenarios is not None:
+            raise ValueError("The results pyramid is not built for batched (multi-scenario) output.")
+        self.pyramid = {}
+        self.pyramid_keys = [key for key in spec if key != 'dt']
+        # Simulated time at the end of the last flushed step (sum of the stored float32 dt)
+        self.elapsed = 0.0
+
+        if resume_steps is not None:
+            self.file = h5py.File(h5_path, 'a')
+            for key, channel in spec.items():
+                # Only complete windows stay on disk; a window open at the checkpoint is restored below
+                n_samples = resume_steps // channel['decimation']
+                for aggregate_name in (channel['aggregate'] or [None]):
+                    name = dataset_name(key, aggregate_name)
+                    if name not in self.file or self.file[name].shape[-1] < n_samples:
+                        self.file.close()
+                        raise ValueError(f"{h5_path} does not match the output spec ({name}); cannot resume.")
+                    self.file[name].resize(n_samples, axis=self.file[name].ndim - 1)
+                self._resume_window(key, resume_steps % channel['decimation'], resume_state)
+            self.steps_written = resume_steps
+            self.file.attrs['completed_steps'] = resume_steps
+            for width in sorted(pyramid_levels or []):
+                self._resume_pyramid_level(width, resume_state)
+            if pyramid_levels:
+                self.elapsed = float(resume_state['pyramid_elapsed'])
+            return
+
+        self.file = h5py.File(h5_path, 'w')
+        self.file.attrs['completed_steps'] = 0
+        if topology is not None:
+            cells = self.file.create_group('cells')
+            cells.create_dataset('label', data=topology['label'].astype(object), dtype=h5py.string_dtype())
+            cells.create_dataset('type', data=topology['type'].astype(object), dtype=h5py.string_dtype())
+            cells.create_dataset('parallel_group', data=topology['parallel_group'])
+        for key, channel in spec.items():
+            chunk_steps = max(1, self.buffer_steps // channel['decimation'])
+            for aggregate_name in (channel['aggregate'] or [None]):
+                name = dataset_name(key, aggregate_name)
+                # One chunk per scenario, so reading a single scenario back touches only its own chunks
+                if channel['cells'] is None:
+                    dset = self.file.create_dataset(name, shape=lead + (0,), maxshape=lead + (None,), dtype='float32',
+                                                    chunks=(1,) * len(lead) + (chunk_steps,), compression='gzip')
+                else:
+                    n_rows = len(channel['cells'])
+                    chunk_rows = min(n_rows, max(1, CELL_CHUNK_BYTES // (4 * chunk_steps)))
+                    dset = self.file.create_dataset(name, shape=lead + (n_rows, 0), maxshape=lead + (n_rows, None),
+                                                    dtype='float32', chunks=(1,) * len(lead) + (chunk_rows, chunk_steps),
+                                                    compression='gzip')
+                    dset.attrs['cell_index'] = channel['cells']
+                dset.attrs['decimation'] = channel['decimation']
+                if aggregate_name is not None:
+                    dset.attrs['aggregate'] = aggregate_name
+        for width in sorted(pyramid_levels or []):
+            self._create_pyramid_level(width)
+
+    def _resume_window(self, key, steps, state):
+        if steps == 0:
+            return
+        prefix = f'window_{key}_'
+        aggregate = self.spec[key]['aggregate']
+        parts = [WINDOW_PARTS[name] for name in (aggregate or [None])]
+        if state is None or any(prefix + part not in state for part in parts) or int(state[prefix + 'steps']) != steps:
+            self.file.close()
+            raise ValueError(f"{self.h5_path} has no open decimation window for {key} in its checkpoint; cannot resume.")
+        self.windows[key] = {'steps': steps}
+        for part in parts:
+            self.windows[key][part] = np.asarray(state[prefix + part])[..., None]
+
+    def _create_pyramid_level(self, width):
+        group = self.file.create_group(f'pyramid/{level_name(width)}')
+        group.attrs['bin_width'] = width
+        # Per bin: time at the end of its last step, total step time and the bin index
+        for name, dtype in [('time', 'float64'), ('duration', 'float64'), ('bin', 'int64')]:
+            group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(PYRAMID_CHUNK_BINS,))
+        for key in self.pyramid_keys:
+            cells = self.spec[key]['cells']
+            for aggregate_name in AGGREGATES:
+                name = f'{key}_{aggregate_name}'
+                if cells is None:
+                    group.create_dataset(name, shape=(0,), maxshape=(None,), dtype='float32',
+                                         chunks=(PYRAMID_CHUNK_BINS,), compression='gzip')
+                else:
+                    n_rows = len(cells)
+                    chunk_rows = min(n_rows, max(1, CELL_CHUNK_BYTES // (4 * PYRAMID_CHUNK_BINS)))
+                    dset = group.create_dataset(name, shape=(n_rows, 0), maxshape=(n_rows, None), dtype='float32',
+                                                chunks=(chunk_rows, PYRAMID_CHUNK_BINS), compression='gzip')
+                    dset.attrs['cell_index'] = cells
+        self.pyramid[width] = {'group': group, 'carry': None}
+
+    def _resume_pyramid_level(self, width, state):
+        # Bins written after the checkpoint are dropped and its open bin becomes the carry again
+        name = f'pyramid/{level_name(width)}'
+        prefix = f'pyramid_{level_name(width)}_'
+        if name not in self.file or state is None or prefix + 'bin' not in state:
+            self.file.close()
+            raise ValueError(f"{self.h5_path} does not match the pyramid levels ({name}); cannot resume.")
+        group = self.file[name]
+        carry_bin = int(state[prefix + 'bin'])
+        keep = int(np.searchsorted(group['bin'][:], carry_bin))
+        for dset in group.values():
+            dset.resize(keep, axis=dset.ndim - 1)
+        carry = None
+        if carry_bin >= 0:
+            carry = {'bin': np.array([carry_bin]), 'time': np.array([float(state[prefix + 'time'])]),
+                     'duration': np.array([float(state[prefix + 'duration'])])}
+            for key in self.pyramid_keys:
+                carry[key] = tuple(np.asarray(state[f'{prefix}{key}_{part}'])[..., None] for part in ['min', 'max', 'sum'])
+        self.pyramid[width] = {'group': group, 'carry': carry}
+
+    def checkpoint_state(self):
+        # Open decimation windows (0 steps: none) and the open bin of every pyramid level (bin -1:
+        # none yet), as flat arrays for write_checkpoint. Only meaningful right after a flush.
+        state = {}
+        for key, channel in self.spec.items():
+            if channel['decimation'] == 1:
+                continue
+            prefix = f'window_{key}_'
+            window = self.windows[key]
+            shape = self.buffer[key].shape[:-1]
+            state[prefix + 'steps'] = np.int64(0 if window is None else window['steps'])
+            for name in (channel['aggregate'] or [None]):
+                part = WINDOW_PARTS[name]
+                state[prefix + part] = np.full(shape, np.nan) if window is None else window[part][..., 0]
+        if not self.pyramid:
+            return state
+        state['pyramid_elapsed'] = np.float64(self.elapsed)
+        for width, level in self.pyramid.items():
+            prefix = f'pyramid_{level_name(width)}_'
+            carry = level['carry']
+            state[prefix + 'bin'] = np.int64(-1 if carry is None else carry['bin'][0])
+            state[prefix + 'time'] = np.float64(np.nan if carry is None else carry['time'][0])
+            state[prefix + 'duration'] = np.float64(np.nan if carry is None else carry['duration'][0])
+            for key in self.pyramid_keys:
+                shape = self.buffer[key].shape[:-1]
+                for i, part in enumerate(['min', 'max', 'sum']):
+                    state[f'{prefix}{key}_{part}'] = np.full(shape, np.nan) if carry is None else carry[key][i][..., 0]
+        return state
+
+    def _feed_pyramid(self, n):
+        # Reduce the first n buffered steps into the finest level; each coarser level is fed the bins
+        # the finer one completes, never the raw steps again
+        dt = self.buffer['dt'][:n].astype(float)
+        t_end = self.elapsed + np.cumsum(dt)
+        self.elapsed = float(t_end[-1])
+        # A step is a bin of its own: min = max = its value, and means are weighted by step length
+        # (the adaptive grid and idle steps are uneven)
+        bins = {'time': t_end, 'duration': dt}
+        for key in self.pyramid_keys:
+            values = self.buffer[key][..., :n]
+            bins[key] = (values, values, values * dt)
+        for width in self.pyramid:
+            bins = self._feed_level(width, bins)
+            if bins is None:
+                break
+
+    def _feed_level(self, width, steps, final=False):
+        # Merge steps (or finer bins: end time, duration and min/max/time-weighted sum per channel)
+        # into the level's bins and write the bins they complete, which are returned. The last bin
+        # stays open (carry) and is merged with the next flush, unless the run is ending.
+        level = self.pyramid[width]
+        carry = level['carry']
+        if steps is None:
+            cols = carry
+        else:
+            bins = pyramid_bins(steps['time'], width)
+            starts = np.flatnonzero(np.diff(bins, prepend=-1))
+            ends = np.append(starts[1:], len(bins)) - 1
+            cols = {'bin': bins[starts], 'time': steps['time'][ends], 'duration': np.add.reduceat(steps['duration'], starts)}
+            for key in self.pyramid_keys:
+                low, high, total = steps[key]
+                cols[key] = (np.minimum.reduceat(low, starts, axis=-1), np.maximum.reduceat(high, starts, axis=-1),
+                             np.add.reduceat(total, starts, axis=-1))
+            if carry is not None and carry['bin'][0] == cols['bin'][0]:
+                cols['duration'][0] += carry['duration'][0]
+                for key in self.pyramid_keys:
+                    low, high, total = cols[key]
+                    low[..., :1] = np.minimum(low[..., :1], carry[key][0])
+                    high[..., :1] = np.maximum(high[..., :1], carry[key][1])
+                    total[..., :1] += carry[key][2]
+            elif carry is not None:
+                for name in ['bin', 'time', 'duration']:
+                    cols[name] = np.concatenate([carry[name], cols[name]])
+                for key in self.pyramid_keys:
+                    cols[key] = tuple(np.concatenate([c, v], axis=-1) for c, v in zip(carry[key], cols[key]))
+        if cols is None:
+            return None
+        window = slice(None) if final else slice(0, -1)
+        self._append_bins(level['group'], cols, window)
+        if final:
+            level['carry'] = None
+        else:
+            level['carry'] = {name: cols[name][-1:].copy() for name in ['bin', 'time', 'duration']}
+            for key in self.pyramid_keys:
+                level['carry'][key] = tuple(part[..., -1:].copy() for part in cols[key])
+        if len(cols['bin'][window]) == 0:
+            return None
+        done = {name: cols[name][window] for name in ['bin', 'time', 'duration']}
+        for key in self.pyramid_keys:
+            done[key] = tuple(part[..., window] for part in cols[key])
+        return done
+
+    def _append_bins(self, group, cols, window):
+        n_new = len(cols['bin'][window])
+        if n_new == 0:
+            return
+        start = group['bin'].shape[0]
+        for name in ['bin', 'time', 'duration']:
+            group[name].resize(start + n_new, axis=0)
+            group[name][start:] = cols[name][window]
+        for key in self.pyramid_keys:
+            low, high, total = (part[..., window] for part in cols[key])
+            for aggregate_name, data in [('min', low), ('max', high), ('mean', total / cols['duration'][window])]:
+                dset = group[f'{key}_{aggregate_name}']
+                dset.resize(start + n_new, axis=dset.ndim - 1)
+                dset[..., start:] = data
+
+    def wants(self, key):
+        return key in self.spec
+
+    def record(self, key, values):
+        channel = self.spec.get(key)
+        if channel is None:
+            return
+        if channel['cells'] is None:
+            self.buffer[key][..., self.slot] = values
+        else:
+            self.buffer[key][..., self.slot] = values[..., channel['cells']]
+
+    def advance(self):
+        self.slot += 1
+        if self.slot == self.buffer_steps:
+            self.flush()
+
+    def flush(self):
+        if self.slot == 0:
+            return
+        for key, channel in self.spec.items():
+            reduced, self.windows[key] = reduce_samples(self.buffer[key][..., :self.slot], channel['decimation'],
+                                                        channel['aggregate'], self.windows[key])
+            self._append_samples(key, reduced)
+        if self.pyramid:
+            self._feed_pyramid(self.slot)
+        self.steps_written += self.slot
+        self.slot = 0
+        # Every step up to here is on disk; readers use this instead of guessing from dt
+        self.file.attrs['completed_steps'] = self.steps_written
+        self.file.flush()
+
+    def _append_samples(self, key, reduced):
+        for aggregate_name, data in reduced.items():
+            if data.shape[-1] == 0:
+                continue
+            dset = self.file[dataset_name(key, aggregate_name)]
+            start = dset.shape[-1]
+            end = start + data.shape[-1]
+            dset.resize(end, axis=dset.ndim - 1)
+            dset[..., start:end] = data
+
+    def series(self, key, cell_idx=None, aggregate_name=None):
+        # Stored samples followed by the (reduced) buffered ones; None if the cell/channel is not recorded
+        channel = self.spec.get(key)
+        if channel is None:
+            return None
+        if channel['aggregate'] and aggregate_name is None:
+            aggregate_name = 'mean' if 'mean' in channel['aggregate'] else channel['aggregate'][0]
+        dset = self.file[dataset_name(key, aggregate_name)]
+        reduced, window = reduce_samples(self.buffer[key][..., :self.slot], channel['decimation'], channel['aggregate'],
+                                         self.windows[key])
+        buffered = reduced[aggregate_name]
+        if window is not None:
+            buffered = np.concatenate([buffered, window_samples(window, channel['aggregate'])[aggregate_name]], axis=-1)
+        if channel['cells'] is None:
+            return np.concatenate([dset[:], buffered])
+        rows = np.nonzero(channel['cells'] == cell_idx)[0]
+        if len(rows) == 0:
+            return None
+        return np.concatenate([dset[rows[0], :], buffered[rows[0]]])
+
+    def series_time(self, key):
+        # Simulated time (s) at the end of each stored sample of `key`
+        time_cum = np.cumsum(self.series('dt'))
+        n = len(time_cum)
+        decimation = self.spec[key]['decimation']
+        return time_cum[np.minimum(np.arange(decimation, n + decimation, decimation), n) - 1]
+
+    def close(self, attrs=None):
+        if not self.file:
+            return
+        self.flush()
+        # A run ending inside a decimation window keeps the partial window as its last sample
+        for key, window in self.windows.items():
+            if window is not None:
+                self._append_samples(key, window_samples(window, self.spec[key]['aggregate']))
+        # The last bin of each level is complete once the run ends (a resume drops and reopens it) and
+        # goes into the next coarser level with the others
+        bins = None
+        for width in self.pyramid:
+            bins = self._feed_level(width, bins, final=True)
+        for key, value in (attrs or {}).items():
+            self.file.attrs[key] = value
+        self.file.close()
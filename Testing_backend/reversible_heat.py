@@ -1,46 +1,131 @@
+import json
 import numpy as np
 
-def calculate_reversible_heat(temp_K, I_current, next_SOC):
-    x_pos_0 = 0.2567
-    x_pos_100 = 0.9072
-    x_neg_0 = 0.0279
-    x_neg_100 = 0.9014
-
-    a0_n = -0.1112
-    a1_n = 0
-    a2_n = 0.3561
-    b1_n = 0.4955
-    b2_n = 0.08309
-    c0_n = 0.02914
-    c1_n = 0.1122
-    c2_n = 0.004616
-    d1_n = 63.9
-
-    a1_p = 0.04006
-    a2_p = -0.06656
-    b1_p = 0.2828
-    b2_p = 0.8032
-    c1_p = 0.0009855
-    c2_p = 0.02179
-
-    next_SOC = max(0.0, min(1.0, next_SOC))
-
-    x_pos = next_SOC * (x_pos_100 - x_pos_0) + x_pos_0
-    x_neg = next_SOC * (x_neg_100 - x_neg_0) + x_neg_0
+# Entropic coefficient fit (dU/dT of each electrode vs. lithiation). Other chemistries pass their
+# own set (inline or as a JSON file) through the 'entropic_coefficients' entry of the thermal config.
+DEFAULT_ENTROPIC_COEFFICIENTS = {
+    'x_pos_0': 0.2567,
+    'x_pos_100': 0.9072,
+    'x_neg_0': 0.0279,
+    'x_neg_100': 0.9014,
+
+    'a0_n': -0.1112,
+    'a1_n': 0,
+    'a2_n': 0.3561,
+    'b1_n': 0.4955,
+    'b2_n': 0.08309,
+    'c0_n': 0.02914,
+    'c1_n': 0.1122,
+    'c2_n': 0.004616,
+    'd1_n': 63.9,
+
+    'a1_p': 0.04006,
+    'a2_p': -0.06656,
+    'b1_p': 0.2828,
+    'b2_p': 0.8032,
+    'c1_p': 0.0009855,
+    'c2_p': 0.02179,
+}
+
+# Largest allowed linear-interpolation error of the dU/dT(SOC) table, V/K (the fit itself is
+# ~1e-4 V/K, so this is ~1e-4 relative); the table is refined until it holds
+ENTROPIC_TABLE_TOLERANCE = 1e-8
+MAX_TABLE_POINTS = 2 ** 16 + 1
+# np.interp binary-searches every SOC, which is cheapest for small packs but slows down when the
+# cell SOCs are spread over the table; above this many values the uniform grid is indexed directly
+INTERP_SEARCH_MAX_CELLS = 512
+
+# Tables keyed on (coefficient set, tolerance) so several chemistries can coexist in one process
+_entropic_tables = {}
+
+
+def load_entropic_coefficients(source=None):
+    # source is None (built-in fit), a dict of coefficients or the path of a JSON file holding one;
+    # coefficients not given keep their built-in values
+    if source is None:
+        source = {}
+    elif isinstance(source, str):
+        with open(source, 'r') as f:
+            source = json.load(f)
+    unknown = set(source) - set(DEFAULT_ENTROPIC_COEFFICIENTS)
+    if unknown:
+        raise ValueError(f"Unknown entropic coefficients: {sorted(unknown)}")
+    return dict(DEFAULT_ENTROPIC_COEFFICIENTS, **source)
+
+
+def calculate_du_dt(SOC, coefficients=DEFAULT_ENTROPIC_COEFFICIENTS):
+    # Analytic dU/dT (V/K) at the given SOC; used to build the lookup table
+    c = coefficients
+    SOC = np.clip(SOC, 0.0, 1.0)
+
+    x_pos = SOC * (c['x_pos_100'] - c['x_pos_0']) + c['x_pos_0']
+    x_neg = SOC * (c['x_neg_100'] - c['x_neg_0']) + c['x_neg_0']
 
     du_dt_pos = (
-        a1_p * np.exp(-((x_pos - b1_p) ** 2) / c1_p)
-        + a2_p * np.exp(-((x_pos - b2_p) ** 2) / c2_p)
+        c['a1_p'] * np.exp(-((x_pos - c['b1_p']) ** 2) / c['c1_p'])
+        + c['a2_p'] * np.exp(-((x_pos - c['b2_p']) ** 2) / c['c2_p'])
     ) / 1000.0
 
     du_dt_neg = (
-        a0_n * x_neg + c0_n
-        + a2_n * np.exp(-((x_neg - b2_n) ** 2) / c2_n)
-        + a1_n * (np.tanh(d1_n * (x_neg - (b1_n - c1_n))) - np.tanh(d1_n * (x_neg - (b1_n + c1_n))))
+        c['a0_n'] * x_neg + c['c0_n']
+        + _a1_term(x_neg, c)
+        + c['a2_n'] * np.exp(-((x_neg - c['b2_n']) ** 2) / c['c2_n'])
     ) / 1000.0
 
-    du_dt = du_dt_pos - du_dt_neg
+    return du_dt_pos - du_dt_neg
+
+
+def _a1_term(x_neg, c):
+    # tanh step of the negative electrode; vanishes in the built-in fit (a1_n = 0)
+    if c['a1_n'] == 0:
+        return 0.0
+    return c['a1_n'] * (np.tanh(c['d1_n'] * (x_neg - (c['b1_n'] - c['c1_n'])))
+                        - np.tanh(c['d1_n'] * (x_neg - (c['b1_n'] + c['c1_n']))))
+
+
+def entropic_table(coefficients=None, tolerance=ENTROPIC_TABLE_TOLERANCE):
+    # Uniform dU/dT(SOC) table on [0, 1], built once per coefficient set. The grid is doubled until
+    # linear interpolation is within tolerance of the analytic fit, measured at 8 points inside every
+    # interval; that measured bound is kept as 'max_error'.
+    coefficients = load_entropic_coefficients(coefficients)
+    key = (tuple(sorted(coefficients.items())), tolerance)
+    if key in _entropic_tables:
+        return _entropic_tables[key]
+
+    n_points = 257
+    while True:
+        soc = np.linspace(0.0, 1.0, n_points)
+        du_dt = calculate_du_dt(soc, coefficients)
+        check = np.linspace(0.0, 1.0, (n_points - 1) * 8 + 1)
+        max_error = float(np.max(np.abs(np.interp(check, soc, du_dt) - calculate_du_dt(check, coefficients))))
+        if max_error <= tolerance or n_points >= MAX_TABLE_POINTS:
+            break
+        n_points = 2 * n_points - 1
+
+    table = {'soc': soc, 'du_dt': du_dt, 'max_error': max_error, 'coefficients': coefficients}
+    _entropic_tables[key] = table
+    return table
+
+
+def lookup_du_dt(table, SOC):
+    # Linear interpolation in the table; SOC outside [0, 1] is clamped to the ends
+    SOC = np.asarray(SOC)
+    if SOC.size <= INTERP_SEARCH_MAX_CELLS:
+        return np.interp(SOC, table['soc'], table['du_dt'])
+    du_dt = table['du_dt']
+    last = len(du_dt) - 1
+    pos = np.clip(SOC, 0.0, 1.0) * last
+    j = np.minimum(pos.astype(np.intp), last - 1)
+    return du_dt[j] + (pos - j) * (du_dt[j + 1] - du_dt[j])
+
+
+def calculate_reversible_heat(temp_K, I_current, next_SOC, table=None):
+    # Works on scalars or on arrays of per-cell temperature/current/SOC. dU/dT comes from the cached
+    # table (built-in fit unless one is passed).
+    if table is None:
+        table = entropic_table()
+    du_dt = lookup_du_dt(table, next_SOC)
 
     q_rev = temp_K * (-I_current) * du_dt
 
-    return q_rev
\ No newline at end of file
+    return q_rev
@@ -0,0 +1,145 @@
+# Testing_backend/setup_cache.py
+# On-disk cache of the built setup. The key is a hash of the pack/drive/model configs and of the
+# modules that build the setup, so editing either gives a new entry. Each entry is one HDF5 file:
+# every array is a contiguous dataset that is memory-mapped on load (copy-on-write, so callers may
+# still modify their setup in place), everything else is one JSON document in the root attributes.
+import os
+import json
+import pickle
+import shutil
+import marshal
+import hashlib
+import argparse
+import tempfile
+import h5py
+import numpy as np
+from data_processor import create_setup
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = '.setup_cache'
+# Modules whose code decides what create_setup returns
+SETUP_SOURCES = ['data_processor.py', 'pack_topology.py', 'initial_conditions.py', 'battery_params.py',
+                 'drive_profile.py', 'calendar_rules.py']
+
+
+def _config_bytes(configs):
+    # marshal is lossless and much faster than json.dumps on large cell lists; it only takes plain
+    # Python values, anything else goes through pickle. Format 2 has no back-references, whose use
+    # in later formats depends on reference counts. Equal configs that serialize differently
+    # (other key order, other Python version) only cost a cache miss.
+    try:
+        return marshal.dumps(configs, 2)
+    except ValueError:
+        return pickle.dumps(configs, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def setup_cache_key(pack, drive, sim):
+    digest = hashlib.sha256()
+    digest.update(f'setup-cache-v{CACHE_FORMAT_VERSION}'.encode())
+    digest.update(_config_bytes([pack, drive, sim]))
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in SETUP_SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _pack_value(value, path, f):
+    # Arrays become datasets named by their path in the setup; the JSON tree keeps a reference
+    if isinstance(value, np.ndarray):
+        name = '/'.join(path)
+        value = np.ascontiguousarray(value)
+        if value.dtype.kind == 'U':
+            # HDF5 has no UCS-4 strings: store the raw code points so labels are memory-mapped too
+            f.create_dataset(name, data=value.view(np.uint32))
+            return {'__array__': name, 'dtype': value.dtype.str}
+        f.create_dataset(name, data=value)
+        return {'__array__': name}
+    if isinstance(value, dict):
+        for key in value:
+            if not isinstance(key, str):
+                raise TypeError(f"Setup keys must be strings to be cached, got {key!r} in {'/'.join(path)}")
+        return {key: _pack_value(item, path + [key], f) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_pack_value(item, path + [str(i)], f) for i, item in enumerate(value)]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_setup(setup_data, path):
+    # Written to a temporary file and renamed, so concurrent workers never see a partial entry
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.h5.tmp', dir=directory)
+    os.close(fd)
+    try:
+        with h5py.File(tmp_path, 'w') as f:
+            tree = _pack_value(setup_data, ['arrays'], f)
+            f.attrs['format_version'] = CACHE_FORMAT_VERSION
+            f.attrs['setup'] = json.dumps(tree)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return path
+
+
+def _load_array(f, path, ref):
+    dset = f[ref['__array__']]
+    offset = dset.id.get_offset()
+    if offset is None or dset.size == 0:
+        # Nothing allocated on disk (empty array)
+        array = dset[()]
+    else:
+        array = np.memmap(path, dtype=dset.dtype, mode='c', offset=offset, shape=dset.shape).view(np.ndarray)
+    return array.view(ref['dtype']) if 'dtype' in ref else array
+
+
+def load_setup(path):
+    with h5py.File(path, 'r') as f:
+        if f.attrs.get('format_version') != CACHE_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a setup cache entry of format version {CACHE_FORMAT_VERSION}.")
+        setup_data = json.loads(f.attrs['setup'],
+                                object_hook=lambda obj: _load_array(f, path, obj) if '__array__' in obj else obj)
+    # The topology is shared read-only, as built by build_pack_topology
+    for key, value in setup_data['topology'].items():
+        for array in value.values() if isinstance(value, dict) else [value]:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+    return setup_data
+
+
+def create_setup_cached(pack, drive, sim, cache_dir=DEFAULT_CACHE_DIR):
+    # Same result as create_setup(pack, drive, sim); built and stored on a miss (cache_dir=None: no cache)
+    if cache_dir is None:
+        return create_setup(pack, drive, sim)
+    path = os.path.join(cache_dir, f'setup_{setup_cache_key(pack, drive, sim)}.h5')
+    if os.path.exists(path):
+        try:
+            return load_setup(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: ignoring unreadable setup cache entry {path} ({e}).")
+    # A miss still reuses the compiled calendar rules stored next to the setups
+    setup_data = create_setup(pack, drive, sim, cache_dir=cache_dir)
+    save_setup(setup_data, path)
+    return setup_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or clear the setup cache.')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--clear', action='store_true', help='Delete every cached setup')
+    args = parser.parse_args()
+
+    if args.clear:
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+        print("Cleared", args.cache_dir)
+    elif os.path.isdir(args.cache_dir):
+        entries = sorted(name for name in os.listdir(args.cache_dir) if name.endswith('.h5'))
+        for name in entries:
+            print(f"{name}  {os.path.getsize(os.path.join(args.cache_dir, name)) / 2**20:8.2f} MB")
+        calendars = [name for name in os.listdir(args.cache_dir) if name.startswith('calendar_')]
+        print(f"{len(entries)} cached setups and {len(calendars)} compiled calendars in {args.cache_dir}")
+    else:
+        print("No setup cache at", args.cache_dir)
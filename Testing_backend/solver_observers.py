@@ -0,0 +1,146 @@
+# Testing_backend/solver_observers.py
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+class SolverObserver:
+    # Progress hooks called by run_electrical_solver. The default does nothing, so headless runs
+    # (sweeps, compute nodes) pay only for the calls themselves.
+    #   on_start(run_info)   run_info: {'n_cells', 'grid_steps', 'total_time'} (total_time in s)
+    #   on_step(step, sim_time)   the committed step dict and the simulated time (s) at its end
+    #   on_finish(counters)  the limit/step counters also written to the HDF5 attributes
+    def on_start(self, run_info):
+        pass
+
+    def on_step(self, step, sim_time):
+        pass
+
+    def on_finish(self, counters):
+        pass
+
+
+class ProgressReporter(SolverObserver):
+    # Prints steps/s, simulated days and an ETA (from the fraction of simulated time done)
+    # at most once every `interval` wall-clock seconds
+    def __init__(self, interval=10.0):
+        self.interval = interval
+
+    def on_start(self, run_info):
+        self.total_time = run_info['total_time']
+        self.steps = 0
+        self.start = time.time()
+        self.last_report = self.start
+
+    def on_step(self, step, sim_time):
+        self.steps += 1
+        now = time.time()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = now - self.start
+        eta = elapsed * (self.total_time - sim_time) / sim_time if sim_time > 0 else float('nan')
+        print(f"Simulated {sim_time / 86400:.1f} / {self.total_time / 86400:.1f} days, {self.steps} steps "
+              f"({self.steps / elapsed:.0f} steps/s), ETA {eta:.0f} s")
+
+    def on_finish(self, counters):
+        elapsed = time.time() - self.start
+        print(f"Finished {self.steps} steps in {elapsed:.1f} s ({self.steps / max(elapsed, 1e-9):.0f} steps/s)")
+
+
+class LivePlotObserver(SolverObserver):
+    # Keeps at most `max_points` points of one cell, each the min/max/mean of the steps it covers: once
+    # the buffer is full neighbouring points are merged and every point covers twice as many steps, so
+    # memory and redraw cost stay fixed for any run length and short peaks still show in the envelope.
+    # The figure and its lines are created once; each refresh only swaps the line data.
+    CHANNELS = ['SOC', 'V_term', 'Qgen', 'I_module']
+
+    def __init__(self, cell=0, interval=10.0, max_points=2000):
+        self.cell = cell
+        self.interval = interval
+        self.max_points = max_points
+
+    def on_start(self, run_info):
+        self.time_days = np.zeros(self.max_points)
+        shape = (len(self.CHANNELS), self.max_points)
+        self.low, self.high, self.mean = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        self._reset_point()
+        self.n = 0
+        self.stride = 1
+        self.skipped = 0
+        self.last_draw = time.time()
+
+        plt.ion() # Turn on interactive mode
+        self.fig, axs = plt.subplots(4, 1, figsize=(14, 12), sharex=True)
+        self.fig.suptitle(f'Simulation Progress for Cell {self.cell}', fontsize=16)
+        styles = [
+            ('SOC', 'blue', 'State of Charge (SOC)', 'SOC Over Time'),
+            ('Terminal Voltage', 'green', 'Terminal Voltage (V)', 'Terminal Voltage Over Time'),
+            ('Heat Generation', 'red', 'Heat Generation (W)', 'Heat Generation Over Time'),
+            ('Module Current', 'purple', 'Current (A)', 'Module Current Over Time'),
+        ]
+        self.axs = axs
+        self.lines = {}
+        self.envelopes = dict.fromkeys(self.CHANNELS)
+        for ax, key, (label, color, ylabel, title) in zip(axs, self.CHANNELS, styles):
+            self.lines[key], = ax.plot([], [], color=color, label=label)
+            ax.set_ylabel(ylabel, fontsize=12)
+            ax.set_title(title, fontsize=14)
+            ax.grid(True, linestyle='--', alpha=0.7)
+            ax.legend(loc='upper right')
+        axs[0].set_ylim(0, 1)
+        axs[1].set_ylim(0, 5)
+        axs[3].set_xlabel('Time (Days)', fontsize=12)
+        self.fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+    def _reset_point(self):
+        self.point_low = np.full(len(self.CHANNELS), np.inf)
+        self.point_high = np.full(len(self.CHANNELS), -np.inf)
+        self.point_sum = np.zeros(len(self.CHANNELS))
+
+    def on_step(self, step, sim_time):
+        values = np.array([step['SOC'][self.cell], step['V_term'][self.cell],
+                           step['Qgen'][self.cell] if step['Qgen'] is not None else np.nan, step['I_module']])
+        self.point_low = np.minimum(self.point_low, values)
+        self.point_high = np.maximum(self.point_high, values)
+        self.point_sum += values
+        self.skipped += 1
+        if self.skipped >= self.stride:
+            self.time_days[self.n] = sim_time / 86400
+            self.low[:, self.n] = self.point_low
+            self.high[:, self.n] = self.point_high
+            self.mean[:, self.n] = self.point_sum / self.skipped
+            self._reset_point()
+            self.skipped = 0
+            self.n += 1
+            if self.n == self.max_points:
+                # Merge pairs while every point still covers the same number of steps
+                half = self.max_points // 2
+                self.time_days[:half] = self.time_days[1::2][:half]
+                self.low[:, :half] = np.minimum(self.low[:, 0::2], self.low[:, 1::2])[:, :half]
+                self.high[:, :half] = np.maximum(self.high[:, 0::2], self.high[:, 1::2])[:, :half]
+                self.mean[:, :half] = (self.mean[:, 0::2] + self.mean[:, 1::2])[:, :half] / 2
+                self.n = half
+                self.stride *= 2
+
+        now = time.time()
+        if now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self.draw()
+
+    def draw(self):
+        t = self.time_days[:self.n]
+        for i, (ax, key) in enumerate(zip(self.axs, self.CHANNELS)):
+            self.lines[key].set_data(t, self.mean[i, :self.n])
+            if self.envelopes[key] is not None:
+                self.envelopes[key].remove()
+            self.envelopes[key] = ax.fill_between(t, self.low[i, :self.n], self.high[i, :self.n],
+                                                  color=self.lines[key].get_color(), alpha=0.25, linewidth=0)
+            ax.relim()
+            ax.autoscale_view(scaley=key in ('Qgen', 'I_module'))
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def on_finish(self, counters):
+        self.draw()
+        plt.ioff()
@@ -0,0 +1,18 @@
+import numpy as np
+from next_soc import calculate_next_soc
+from reversible_heat import calculate_reversible_heat
+
+def calculate_state_update(I_cells, dt, capacity, coulombic_efficiency, sim_SOC, sim_SOH, sim_Temp, sim_V_term, sim_V_R0,
+                           heat=True, energy=True, entropic=None):
+    # One pass over all cells: SOC step, heat split and energy moved in this step.
+    # Heat and energy are skipped (returned as None) when nothing downstream records them.
+    # entropic is the dU/dT table from reversible_heat.entropic_table (built-in fit if None).
+    next_SOC = calculate_next_soc(I_cells, dt, capacity, sim_SOC, coulombic_efficiency, sim_SOH)
+    q_irr = q_rev = q_gen = energy_step = None
+    if heat:
+        q_irr = I_cells ** 2 * sim_V_R0
+        q_rev = calculate_reversible_heat(sim_Temp, I_cells, sim_SOC, entropic)
+        q_gen = q_irr + q_rev
+    if energy:
+        energy_step = np.abs(I_cells * sim_V_term * dt) / (3600 * 1000)
+    return next_SOC, q_irr, q_rev, q_gen, energy_step
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend modules are flat files in Testing_backend/, imported by name as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from aging_model import aging_step, build_aging_model
+
+
+def run_one_update(SOH, DCIR_AgingFactor, life_config=None):
+    n = len(SOH)
+    aging = build_aging_model(life_config or {}, n, capacity=5.0)
+    T = np.full(n, 308.15)
+    energy_throughput = np.full(n, 0.5)
+    return aging_step(aging, 86400.0, T, np.array(SOH), np.array(DCIR_AgingFactor), energy_throughput)
+
+
+def test_fade_never_raises_soh():
+    # Below, at, just above and well above min_soh (0.5)
+    SOH = np.array([0.3, 0.5, 0.5001, 0.95])
+    DCIR = np.ones(4)
+    new_SOH, new_DCIR = run_one_update(SOH, DCIR)
+    assert np.all(new_SOH <= SOH)
+    assert np.all(new_DCIR >= DCIR)
+    assert new_SOH[0] == 0.3 and new_DCIR[0] == 1.0
+    assert new_SOH[1] == 0.5 and new_DCIR[1] == 1.0
+    assert new_SOH[2] == 0.5
+    assert new_SOH[3] < 0.95 and new_DCIR[3] > 1.0
+
+
+def test_no_update_before_interval():
+    aging = build_aging_model({}, 2, capacity=5.0)
+    assert aging_step(aging, 3600.0, np.full(2, 298.15), np.ones(2), np.ones(2), np.zeros(2)) is None
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from cell_kernels import fused_cell_update
+from reversible_heat import entropic_table
+
+OUTPUTS = ['next_SOC', 'q_irr', 'q_rev', 'q_gen', 'energy_step', 'energy_total', 'Qgen_total']
+
+
+def random_state(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    I_cells = rng.uniform(-20.0, 20.0, n)
+    I_cells[:10] = 0.0
+    SOC = rng.uniform(0.0, 1.0, n)
+    # Cells that clamp at empty and full within the step
+    SOC[10:20] = 1e-4
+    I_cells[10:20] = 15.0
+    SOC[20:30] = 1.0 - 1e-4
+    I_cells[20:30] = -15.0
+    SOC[30:35] = [0.0, 1.0, 0.0, 1.0, 0.5]
+    return {
+        'I_cells': I_cells,
+        'capacity': rng.uniform(4.5, 5.5, n),
+        'SOC': SOC,
+        'SOH': rng.uniform(0.7, 1.0, n),
+        'Temp': rng.uniform(280.0, 330.0, n),
+        'V_term': rng.uniform(2.5, 4.2, n),
+        'R0': rng.uniform(0.01, 0.05, n),
+        'energy_throughput': rng.uniform(0.0, 10.0, n).astype('float32'),
+        'Qgen_cumulative': rng.uniform(0.0, 1e4, n).astype('float32'),
+    }
+
+
+def run_backend(backend, x, dt=60.0, coulombic_efficiency=0.99):
+    return dict(zip(OUTPUTS, fused_cell_update(
+        backend, x['I_cells'], dt, x['capacity'], coulombic_efficiency, x['SOC'], x['SOH'], x['Temp'],
+        x['V_term'], x['R0'], x['energy_throughput'], x['Qgen_cumulative'], entropic=entropic_table()
+    )))
+
+
+def assert_matches_numpy(backend):
+    x = random_state()
+    expected = run_backend('numpy', x)
+    result = run_backend(backend, x)
+    for key in OUTPUTS:
+        assert result[key].dtype == expected[key].dtype, key
+        # The loop sums in a different order than NumPy, so allow a few ulps
+        np.testing.assert_allclose(result[key], expected[key], rtol=1e-12, atol=1e-12, err_msg=key)
+
+
+def test_python_loop_matches_numpy():
+    assert_matches_numpy('python')
+
+
+def test_numba_matches_numpy():
+    pytest.importorskip('numba')
+    assert_matches_numpy('numba')
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from initial_conditions import init_initial_cell_state
+
+
+def test_varying_cells_override_defaults():
+    state = init_initial_cell_state(4, 298.15, 0.5, 1.0, 1.0, [2, 4], [300.0, 310.0], [0.2, 0.9], [0.95, 0.85],
+                                    [1.1, 1.3])
+    assert np.array_equal(state['temperature'], [298.15, 300.0, 298.15, 310.0])
+    assert np.array_equal(state['SOC'], [0.5, 0.2, 0.5, 0.9])
+    assert np.array_equal(state['SOH'], [1.0, 0.95, 1.0, 0.85])
+    assert np.array_equal(state['DCIR_AgingFactor'], [1.0, 1.1, 1.0, 1.3])
+
+
+@pytest.mark.parametrize('lengths', [(2, 2, 1, 2, 2), (2, 2, 2, 2, 3), (1, 2, 2, 2, 2)])
+def test_varying_lists_of_different_lengths_are_rejected(lengths):
+    lists = [list(range(1, n + 1)) for n in lengths]
+    with pytest.raises(ValueError):
+        init_initial_cell_state(4, 298.15, 0.5, 1.0, 1.0, *lists)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from pack_topology import build_pack_topology
+
+
+def make_layers(n_layers, n_rows, n_cols):
+    return [{'n_rows': n_rows, 'n_cols': n_cols, 'pitch_x': 0.02, 'pitch_y': 0.02, 'z_center': 0.07 * l}
+            for l in range(n_layers)]
+
+
+def make_cells(n):
+    return [{'dims': {'radius': 0.01, 'height': 0.07}} for _ in range(n)]
+
+
+@pytest.mark.parametrize('connection_type', ['row_series_column_parallel', 'row_parallel_column_series'])
+@pytest.mark.parametrize('shape', [(2, 3, 3), (2, 2, 4), (3, 4, 2)])
+def test_multi_layer_series_chain(connection_type, shape):
+    n_layers, n_rows, n_cols = shape
+    topology = build_pack_topology(make_cells(n_layers * n_rows * n_cols), make_layers(*shape), connection_type)
+    groups_per_layer = n_rows if connection_type == 'row_series_column_parallel' else n_cols
+    # Groups are numbered consecutively and never span two layers
+    assert list(topology['group_ids']) == list(range(1, n_layers * groups_per_layer + 1))
+    for group in topology['group_ids']:
+        assert len(np.unique(topology['layer_index'][topology['parallel_group'] == group])) == 1
+    # Every series link goes to the next group, in the same column (row-series) or row (column-series)
+    along = topology['col_index'] if connection_type == 'row_series_column_parallel' else topology['row_index']
+    linked = np.nonzero(topology['next_series'] >= 0)[0]
+    targets = topology['next_series'][linked]
+    assert np.array_equal(topology['parallel_group'][targets], topology['parallel_group'][linked] + 1)
+    assert np.array_equal(along[targets], along[linked])
+    # Only the last group of the last layer ends the chain
+    ends = topology['next_series'] < 0
+    assert np.all(topology['parallel_group'][ends] == topology['group_ids'][-1])
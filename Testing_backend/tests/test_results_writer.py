@@ -0,0 +1,48 @@
+import h5py
+import numpy as np
+import pytest
+
+from output_spec import build_pyramid_levels
+from results_writer import StreamingResultsWriter, pyramid_bins
+
+
+def test_pyramid_levels_match_raw_steps(tmp_path):
+    rng = np.random.default_rng(0)
+    n_steps, n_cells = 2500, 3
+    # Uneven steps, some longer than the finest bin, so bins are skipped and span several flushes
+    dt = rng.choice([5.0, 30.0, 60.0, 600.0, 5000.0], n_steps, p=[0.3, 0.3, 0.3, 0.08, 0.02])
+    SOC = rng.uniform(0.0, 1.0, (n_cells, n_steps))
+    spec = {'SOC': {'cells': np.arange(n_cells), 'decimation': 1, 'aggregate': None},
+            'dt': {'cells': None, 'decimation': 1, 'aggregate': None}}
+    writer = StreamingResultsWriter(tmp_path / 'results.h5', spec, buffer_steps=300, pyramid_levels=[60, 3600, 86400])
+    for k in range(n_steps):
+        writer.record('dt', dt[k])
+        writer.record('SOC', SOC[:, k])
+        writer.advance()
+    writer.close()
+
+    dt = dt.astype('float32').astype(float)
+    SOC = SOC.astype('float32')
+    t_end = np.cumsum(dt)
+    with h5py.File(tmp_path / 'results.h5', 'r') as f:
+        for width in [60, 3600, 86400]:
+            level = f[f'pyramid/{width:g}']
+            bins = pyramid_bins(t_end, width)
+            expected = np.unique(bins)
+            assert np.array_equal(level['bin'][()], expected), width
+            members = [bins == b for b in expected]
+            np.testing.assert_allclose(level['duration'][()], [dt[m].sum() for m in members])
+            assert np.array_equal(level['time'][()], [t_end[m][-1] for m in members])
+            # Coarser levels come from the finer bins, so only the means see a different summation order
+            assert np.array_equal(level['SOC_min'][()], np.stack([SOC[:, m].min(axis=-1) for m in members], axis=-1))
+            assert np.array_equal(level['SOC_max'][()], np.stack([SOC[:, m].max(axis=-1) for m in members], axis=-1))
+            mean = np.stack([SOC[:, m] @ dt[m] / dt[m].sum() for m in members], axis=-1)
+            np.testing.assert_allclose(level['SOC_mean'][()], mean, rtol=1e-6)
+
+
+def test_pyramid_levels_skip_widths_within_a_step():
+    assert build_pyramid_levels({'pyramid': [86400, 60, 3600]}) == [60, 3600, 86400]
+    assert build_pyramid_levels({'pyramid': [60, 3600, 86400]}, typical_dt=60.0) == [3600, 86400]
+    assert build_pyramid_levels({'pyramid': []}, typical_dt=60.0) == []
+    with pytest.raises(ValueError):
+        build_pyramid_levels({'pyramid': [60, 90]})
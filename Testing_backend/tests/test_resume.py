@@ -0,0 +1,79 @@
+import json
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from data_processor import create_setup
+from electrical_solver import run_electrical_solver, resume_electrical_solver
+from solver_observers import SolverObserver
+
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Interrupt(Exception):
+    pass
+
+
+class StopAfter(SolverObserver):
+    # Stands in for a crash part-way through the run
+    def __init__(self, steps):
+        self.steps = steps
+        self.seen = 0
+
+    def on_step(self, step, sim_time):
+        self.seen += 1
+        if self.seen == self.steps:
+            raise Interrupt
+
+
+def make_setup(adaptive):
+    pack, drive, sim = [json.load(open(os.path.join(CONFIG_DIR, f'{name}_config.json')))
+                        for name in ['pack', 'drive', 'model']]
+    drive['numDays'] = 20
+    sim['electrical']['adaptive']['enabled'] = adaptive
+    sim['thermal']['enabled'] = True
+    sim['life']['enabled'] = True
+    # Window lengths that do not divide the 1000-step buffer, so windows are open at every checkpoint
+    channels = {key: {} for key in ['Vterm', 'I_module', 'V_module', 'temperature', 'SOH']}
+    channels['SOC'] = {'decimation': 7}
+    channels['Qgen'] = {'decimation': 13, 'aggregate': ['min', 'max', 'mean']}
+    sim['output']['channels'] = channels
+    return create_setup(pack, drive, sim)
+
+
+def read_all(path):
+    # Every dataset and attribute in the file, keyed by path
+    out = {}
+    with h5py.File(path, 'r') as f:
+        out['/'] = dict(f.attrs)
+
+        def visit(name, obj):
+            out[name] = dict(obj.attrs)
+            if isinstance(obj, h5py.Dataset):
+                out[name]['data'] = obj[()]
+        f.visititems(visit)
+    return out
+
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_resumed_run_matches_straight_run(tmp_path, adaptive):
+    straight = tmp_path / 'straight.h5'
+    resumed = tmp_path / 'resumed.h5'
+    run_electrical_solver(make_setup(adaptive), h5_path=straight, observers=[SolverObserver()])
+    # Past the first checkpoint (1000 steps), so the steps after it are dropped and solved again
+    with pytest.raises(Interrupt):
+        run_electrical_solver(make_setup(adaptive), h5_path=resumed, observers=[StopAfter(1020)])
+    resume_electrical_solver(make_setup(adaptive), h5_path=resumed, observers=[SolverObserver()])
+
+    expected = read_all(straight)
+    result = read_all(resumed)
+    assert any(name.startswith('pyramid/') for name in expected)
+    assert expected.keys() == result.keys()
+    for name, attrs in expected.items():
+        assert attrs.keys() == result[name].keys(), name
+        for key, value in attrs.items():
+            # Checkpoints store nan for decimation windows and pyramid bins that are not open
+            equal_nan = np.asarray(value).dtype.kind == 'f'
+            assert np.array_equal(value, result[name][key], equal_nan=equal_nan), (name, key)
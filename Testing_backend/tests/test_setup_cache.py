@@ -0,0 +1,68 @@
+import json
+import os
+
+import numpy as np
+
+from data_processor import create_setup
+from setup_cache import load_setup, save_setup
+
+CONFIG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_configs():
+    pack, drive, sim = [json.load(open(os.path.join(CONFIG_DIR, f'{name}_config.json')))
+                        for name in ['pack', 'drive', 'model']]
+    drive['numDays'] = 30
+    return pack, drive, sim
+
+
+def assert_same(expected, result, path='setup'):
+    if isinstance(expected, np.ndarray):
+        assert isinstance(result, np.ndarray), path
+        assert result.dtype == expected.dtype, path
+        assert result.shape == expected.shape, path
+        assert result.flags.writeable == expected.flags.writeable, path
+        assert np.array_equal(result, expected, equal_nan=expected.dtype.kind in 'fc'), path
+    elif isinstance(expected, dict):
+        assert isinstance(result, dict) and result.keys() == expected.keys(), path
+        for key in expected:
+            assert_same(expected[key], result[key], f'{path}/{key}')
+    elif isinstance(expected, (list, tuple)):
+        assert type(result) is type(expected) and len(result) == len(expected), path
+        for i, (a, b) in enumerate(zip(expected, result)):
+            assert_same(a, b, f'{path}/{i}')
+    else:
+        assert result == expected or (result != result and expected != expected), path
+
+
+def test_round_trip_matches_create_setup(tmp_path):
+    expected = create_setup(*load_configs())
+    result = load_setup(save_setup(create_setup(*load_configs()), tmp_path / 'setup.h5'))
+    assert_same(expected, result)
+
+
+def test_arrays_without_a_plain_hdf5_layout(tmp_path):
+    # Unicode labels (stored as code points) and zero-size arrays (nothing on disk to map)
+    setup = {
+        'topology': {'label': np.array(['R1C1L1', 'R10C2L1']), 'empty': np.zeros((0, 3))},
+        'names': np.array([], dtype='<U4'),
+        'nested': [{'values': np.arange(4, dtype=np.int32)}, 'text', 1.5, None],
+    }
+    # The topology comes back read-only, as build_pack_topology makes it
+    for array in setup['topology'].values():
+        array.flags.writeable = False
+    result = load_setup(save_setup(setup, tmp_path / 'setup.h5'))
+    assert_same(setup, result)
+
+
+def test_editing_a_loaded_setup_leaves_the_file_alone(tmp_path):
+    path = save_setup(create_setup(*load_configs()), tmp_path / 'setup.h5')
+    loaded = load_setup(path)
+    original = {key: value.copy() for key, value in loaded['initial_state'].items()}
+    # What parameter_sweep does for cell.N.* overrides
+    for value in loaded['initial_state'].values():
+        value[0] += 1.0
+    reloaded = load_setup(path)
+    for key, value in original.items():
+        assert np.array_equal(reloaded['initial_state'][key], value), key
+        assert loaded['initial_state'][key][0] == value[0] + 1.0, key
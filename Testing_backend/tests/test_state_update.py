@@ -0,0 +1,112 @@
+import numpy as np
+from next_soc import calculate_next_soc
+from reversible_heat import calculate_reversible_heat, calculate_du_dt, entropic_table
+from state_update import calculate_state_update
+
+
+def scalar_next_soc(I_current, dt, capacity, current_SOC, coulombic_efficiency, SOH):
+    # Per-cell SOC update of the original solver loop
+    effective_capacity_As = capacity * SOH * 3600
+    if I_current < 0:
+        next_SOC = current_SOC - (I_current * dt / effective_capacity_As) * coulombic_efficiency
+    else:
+        next_SOC = current_SOC - (I_current * dt / effective_capacity_As)
+    return max(0.0, min(1.0, next_SOC))
+
+
+def scalar_du_dt(SOC):
+    # Per-cell entropic fit of the original reversible_heat.py
+    x_pos_0, x_pos_100, x_neg_0, x_neg_100 = 0.2567, 0.9072, 0.0279, 0.9014
+    a0_n, a1_n, a2_n, b1_n, b2_n, c0_n, c1_n, c2_n, d1_n = -0.1112, 0, 0.3561, 0.4955, 0.08309, 0.02914, 0.1122, 0.004616, 63.9
+    a1_p, a2_p, b1_p, b2_p, c1_p, c2_p = 0.04006, -0.06656, 0.2828, 0.8032, 0.0009855, 0.02179
+    SOC = max(0.0, min(1.0, SOC))
+    x_pos = SOC * (x_pos_100 - x_pos_0) + x_pos_0
+    x_neg = SOC * (x_neg_100 - x_neg_0) + x_neg_0
+    du_dt_pos = (
+        a1_p * np.exp(-((x_pos - b1_p) ** 2) / c1_p)
+        + a2_p * np.exp(-((x_pos - b2_p) ** 2) / c2_p)
+    ) / 1000.0
+    du_dt_neg = (
+        a0_n * x_neg + c0_n
+        + a2_n * np.exp(-((x_neg - b2_n) ** 2) / c2_n)
+        + a1_n * (np.tanh(d1_n * (x_neg - (b1_n - c1_n))) - np.tanh(d1_n * (x_neg - (b1_n + c1_n))))
+    ) / 1000.0
+    return du_dt_pos - du_dt_neg
+
+
+def random_cells(n=400, seed=0):
+    # Both current signs, and SOCs near the ends with steps large enough to clamp at 0 and 1
+    rng = np.random.default_rng(seed)
+    cells = {
+        'I': rng.uniform(-60.0, 60.0, n),
+        'SOC': rng.uniform(0.0, 1.0, n),
+        'SOH': rng.uniform(0.7, 1.0, n),
+        'Temp': rng.uniform(250.0, 330.0, n),
+        'V_term': rng.uniform(2.5, 4.2, n),
+        'R0': rng.uniform(0.005, 0.05, n),
+    }
+    cells['SOC'][:20] = rng.uniform(0.0, 0.002, 20)
+    cells['I'][:20] = rng.uniform(20.0, 60.0, 20)
+    cells['SOC'][20:40] = rng.uniform(0.998, 1.0, 20)
+    cells['I'][20:40] = rng.uniform(-60.0, -20.0, 20)
+    cells['SOC'][40] = 0.0
+    cells['SOC'][41] = 1.0
+    cells['I'][42] = 0.0
+    return cells
+
+
+def test_next_soc_matches_scalar_path():
+    c = random_cells()
+    dt, capacity, efficiency = 60.0, 2.5, 0.98
+    next_SOC = calculate_next_soc(c['I'], dt, capacity, c['SOC'], efficiency, c['SOH'])
+    expected = np.array([scalar_next_soc(I, dt, capacity, soc, efficiency, soh)
+                         for I, soc, soh in zip(c['I'], c['SOC'], c['SOH'])])
+    np.testing.assert_array_equal(next_SOC, expected)
+    assert np.all(next_SOC[:20] == 0.0)
+    assert np.all(next_SOC[20:40] == 1.0)
+    # Scalars still come back as floats
+    assert isinstance(calculate_next_soc(1.0, dt, capacity, 0.5, efficiency, 1.0), float)
+
+
+def test_du_dt_fit_matches_scalar_path():
+    soc = np.concatenate([np.random.default_rng(1).uniform(-0.1, 1.1, 500), [0.0, 1.0]])
+    np.testing.assert_array_equal(calculate_du_dt(soc), [scalar_du_dt(s) for s in soc])
+
+
+def test_reversible_heat_matches_scalar_path():
+    c = random_cells(seed=2)
+    table = entropic_table()
+    q_rev = calculate_reversible_heat(c['Temp'], c['I'], c['SOC'], table)
+    # Elementwise: the array call gives what one call per cell gives
+    np.testing.assert_array_equal(q_rev, [calculate_reversible_heat(T, I, s, table)
+                                          for T, I, s in zip(c['Temp'], c['I'], c['SOC'])])
+    # The dU/dT table stays within its measured interpolation error of the original fit
+    expected = np.array([T * (-I) * scalar_du_dt(s) for T, I, s in zip(c['Temp'], c['I'], c['SOC'])])
+    bound = c['Temp'] * np.abs(c['I']) * table['max_error']
+    assert np.all(np.abs(q_rev - expected) <= bound * (1 + 1e-9) + 1e-15)
+
+
+def test_state_update_matches_scalar_loop():
+    c = random_cells(seed=3)
+    dt, capacity, efficiency = 30.0, 2.5, 0.98
+    table = entropic_table()
+    next_SOC, q_irr, q_rev, q_gen, energy = calculate_state_update(
+        c['I'], dt, capacity, efficiency, c['SOC'], c['SOH'], c['Temp'], c['V_term'], c['R0'], entropic=table
+    )
+    for i in range(len(c['I'])):
+        I = c['I'][i]
+        assert next_SOC[i] == scalar_next_soc(I, dt, capacity, c['SOC'][i], efficiency, c['SOH'][i])
+        assert q_irr[i] == I ** 2 * c['R0'][i]
+        # Entropic heat uses the SOC at the start of the step, as the scalar loop did
+        assert q_rev[i] == calculate_reversible_heat(c['Temp'][i], I, c['SOC'][i], table)
+        assert q_gen[i] == q_irr[i] + q_rev[i]
+        assert energy[i] == abs(I * c['V_term'][i] * dt) / (3600 * 1000)
+
+
+def test_state_update_skips_unrequested_outputs():
+    c = random_cells(seed=4)
+    next_SOC, q_irr, q_rev, q_gen, energy = calculate_state_update(
+        c['I'], 60.0, 2.5, 0.98, c['SOC'], c['SOH'], c['Temp'], c['V_term'], c['R0'], heat=False, energy=False
+    )
+    assert q_irr is None and q_rev is None and q_gen is None and energy is None
+    np.testing.assert_array_equal(next_SOC, calculate_next_soc(c['I'], 60.0, 2.5, c['SOC'], 0.98, c['SOH']))
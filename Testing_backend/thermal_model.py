@@ -0,0 +1,100 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from pack_topology import NEIGHBOR_KINDS
+
+# Convective film coefficients (W/m^2K) for the cooling types offered by the frontend
+COOLING_H = {'none': 5.0, 'air': 25.0, 'liquid': 250.0}
+# Contact conductance (W/K) between a cell and one neighbour of each adjacency kind
+DEFAULT_CONDUCTANCE = {'row': 0.5, 'col': 0.5, 'diagonal': 0.1}
+DEFAULT_SPECIFIC_HEAT = 1000.0 # J/kgK
+DEFAULT_AMBIENT_TEMPERATURE = 300.0 # K
+# Backward-Euler factorizations kept per thermal model; the fixed grid only has a handful of
+# distinct step sizes, adaptive runs can produce many
+MAX_CACHED_FACTORIZATIONS = 64
+
+
+def cell_surface_area(dims):
+    # Cylinders (radius/height) or boxes (length/width/height), in m^2
+    nan = np.full_like(dims['height'], np.nan)
+    radius = dims.get('radius', nan)
+    box = 2 * (dims.get('length', nan) * dims.get('width', nan)
+               + (dims.get('length', nan) + dims.get('width', nan)) * dims['height'])
+    cylinder = 2 * np.pi * radius * (radius + dims['height'])
+    return np.where(np.isnan(radius), box, cylinder)
+
+
+def build_conductance_matrix(topology, conductance):
+    # Sparse thermal Laplacian L with (L @ T)_i = sum_j k_ij (T_i - T_j) over the CSR neighbour
+    # lists of the topology, so applying it costs O(cells) per step
+    n_cells = topology['n_cells']
+    k = np.array([conductance[kind] for kind in NEIGHBOR_KINDS], dtype=float)[topology['neighbor_kind']]
+    adjacency = sp.csr_matrix((k, topology['neighbor_index'], topology['neighbor_ptr']), shape=(n_cells, n_cells))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    return (sp.diags(degree) - adjacency).tocsr()
+
+
+def build_thermal_model(thermal_config, topology, masses):
+    # thermal_config is the 'thermal' section of model_config.json; every cell is one lumped
+    # thermal mass exchanging heat with its neighbours and with the coolant/ambient
+    model = thermal_config.get('model') or 'lumped'
+    if model != 'lumped':
+        raise ValueError(f"Unsupported thermal model: {model}. Only 'lumped' is implemented.")
+    cooling = thermal_config.get('cooling') or 'none'
+    h = dict(COOLING_H, **(thermal_config.get('h_coefficients') or {})).get(cooling)
+    if h is None:
+        raise ValueError(f"Unknown cooling type: {cooling}. Use one of {list(COOLING_H)}.")
+    conductance = dict(DEFAULT_CONDUCTANCE, **(thermal_config.get('conductance') or {}))
+
+    heat_capacity = np.full(topology['n_cells'], masses['cell'] * thermal_config.get('specific_heat', DEFAULT_SPECIFIC_HEAT))
+    hA = h * cell_surface_area(topology['dims'])
+    L = build_conductance_matrix(topology, conductance)
+    integrator = thermal_config.get('integrator', 'implicit')
+    if integrator not in ('implicit', 'explicit'):
+        raise ValueError(f"Unknown thermal integrator: {integrator}. Use 'implicit' or 'explicit'.")
+    # Gershgorin bound on the largest decay rate; explicit steps no longer than its inverse stay stable
+    max_rate = np.max((2 * L.diagonal() + hA) / heat_capacity)
+    return {
+        'heat_capacity': heat_capacity,
+        'conductance': L,
+        'hA': hA,
+        'T_ambient': thermal_config.get('ambient_temperature', DEFAULT_AMBIENT_TEMPERATURE),
+        'max_dt': 1.0 / max_rate,
+        'integrator': integrator,
+        'factorizations': {},
+    }
+
+
+def thermal_step(thermal, T, Q, dt):
+    # C dT/dt = Q - L T - hA (T - T_ambient), with Q held at the electrical step's value.
+    # T and Q are (cells,) or (scenarios, cells); a batch of scenarios shares one factorization.
+    if thermal['integrator'] == 'explicit':
+        return _explicit_step(thermal, T, Q, dt)
+    return _implicit_step(thermal, T, Q, dt)
+
+
+def _implicit_step(thermal, T, Q, dt):
+    # Backward Euler: (C/dt + hA + L) T_new = C/dt T + Q + hA T_ambient. Unconditionally stable,
+    # so a multi-hour idle step is one triangular solve with the factorization cached for its dt.
+    factorizations = thermal['factorizations']
+    lu = factorizations.get(dt)
+    if lu is None:
+        if len(factorizations) >= MAX_CACHED_FACTORIZATIONS:
+            del factorizations[next(iter(factorizations))]
+        system = thermal['conductance'] + sp.diags(thermal['heat_capacity'] / dt + thermal['hA'])
+        lu = factorizations[dt] = splu(system.tocsc())
+    C_dt = thermal['heat_capacity'] / dt
+    return lu.solve((C_dt * T + Q + thermal['hA'] * thermal['T_ambient']).T).T
+
+
+def _explicit_step(thermal, T, Q, dt):
+    # Forward Euler split into equal sub-steps no longer than the stability limit
+    n_sub = max(1, int(np.ceil(dt / thermal['max_dt'])))
+    h = dt / n_sub
+    C = thermal['heat_capacity']
+    L = thermal['conductance']
+    hA = thermal['hA']
+    T_ambient = thermal['T_ambient']
+    for _ in range(n_sub):
+        T = T + h / C * (Q - (L @ T.T).T - hA * (T - T_ambient))
+    return T